@@ -0,0 +1,593 @@
+"""
+End-to-end benchmarks for Bing Image Creator GUI
+
+Runs the GUI path (generate_images -> save_current_image) and the headless
+batch pipeline against local fake Bing and Ollama servers, so performance
+can be measured without cookies or a running Ollama. Latency, failure rate
+and image size of the fakes are configurable.
+
+Each benchmark runs several times and the median of every metric is kept.
+Results are compared against a stored baseline and the script exits with
+status 1 when throughput, median latency or memory regress beyond the
+tolerance:
+
+    python benchmark.py                    # run and compare to the baseline
+    python benchmark.py --save-baseline    # run and store a new baseline
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import statistics
+import random
+import argparse
+import tempfile
+import contextlib
+import threading
+import http.server
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QBuffer, QIODevice
+from PyQt6.QtGui import QImage, QColor
+
+import bing_img_creator_gui as app_module
+
+BASELINE_FILE = Path(__file__).resolve().parent / "benchmark_baseline.json"
+FAKE_MODEL = "fake-llm:latest"
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unknown"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def make_jpeg(width, height, seed=0):
+    """Encode a noisy test image, which compresses about like a real one"""
+    rng = random.Random(seed)
+    image = QImage(width, height, QImage.Format.Format_RGB32)
+    image.fill(QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    for y in range(0, height, 8):
+        for x in range(0, width, 8):
+            color = QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)).rgb()
+            image.setPixel(x, y, color)
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, "JPG", 90)
+    return bytes(buffer.data())
+
+
+def unique_jpeg(base, tag):
+    """Make the image bytes unique per URL by adding a JPEG comment segment"""
+    comment = tag.encode("utf-8")[:60000]
+    segment = b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment
+    return base[:2] + segment + base[2:]
+
+
+class QuietHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections is expected, not a failure
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeServer:
+    """Threaded local HTTP server with configurable latency and failures"""
+
+    def __init__(self, handler_class, latency=0.0, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.requests = 0
+        handler = type(handler_class.__name__, (handler_class,), {"server_state": self})
+        self.httpd = QuietHTTPServer(("127.0.0.1", 0), handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def should_fail(self):
+        with self.random_lock:
+            self.requests += 1
+            return self.random.random() < self.failure_rate
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_state = None
+
+    def send_body(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, payload, status=200):
+        self.send_body(status, json.dumps(payload).encode("utf-8"))
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeBingHandler(FakeHandler):
+    """Serves generated images at /images/<id>.jpg like the Bing CDN"""
+
+    def do_GET(self):
+        state = self.server_state
+        time.sleep(state.latency)
+        if state.should_fail():
+            self.send_json({"error": "service unavailable"}, 503)
+            return
+        self.send_body(200, unique_jpeg(state.image, self.path), "image/jpeg")
+
+
+class FakeOllamaHandler(FakeHandler):
+    """Implements the parts of the Ollama API the application uses"""
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self.send_json({"models": [{"name": FAKE_MODEL}]})
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        state = self.server_state
+        request = self.read_json()
+        if self.path != "/api/generate":
+            self.send_json({"error": "not found"}, 404)
+            return
+        if state.should_fail():
+            self.send_json({"error": "model failed to load"}, 500)
+            return
+
+        # The first request for a model pays its load time, like a cold start
+        with state.random_lock:
+            cold = request.get("model") not in state.loaded_models
+            state.loaded_models.add(request.get("model"))
+        load_duration = state.load_time if cold else 0.0
+        time.sleep(load_duration)
+        if "prompt" not in request:
+            self.send_json({"model": request.get("model"), "response": "", "done": True,
+                            "done_reason": "load", "load_duration": int(load_duration * 1e9)})
+            return
+
+        if request.get("format") == "json":
+            self.send_batch(request, load_duration)
+            return
+
+        words = request.get("prompt", "").split()[-state.tokens:]
+        tokens = [word + " " for word in words] or ["prompt "]
+        if not request.get("stream"):
+            time.sleep(state.latency + state.token_delay * len(tokens))
+            self.send_json({"model": request.get("model"), "response": "".join(tokens), "done": True,
+                            "load_duration": int(load_duration * 1e9)})
+            return
+
+        time.sleep(state.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(state.token_delay)
+            self.write_chunk({"response": token, "done": False})
+        self.write_chunk({"response": "", "done": True, "load_duration": int(load_duration * 1e9)})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_batch(self, request, load_duration):
+        """Answer a numbered multi-phrase instruction with one JSON object"""
+        state = self.server_state
+        entries = re.findall(r"^(\d+)\. (.*)$", request.get("prompt", ""), re.MULTILINE)
+        prompts = []
+        for number, text in entries:
+            with state.random_lock:
+                dropped = state.random.random() < state.drop_rate
+            if not dropped:
+                words = text.split()[:state.tokens]
+                prompts.append({"id": int(number), "prompt": " ".join(words)})
+        # One request pays the latency once; generation time still scales with the output
+        time.sleep(state.latency + state.token_delay * state.tokens * len(entries))
+        self.send_json({"model": request.get("model"), "response": json.dumps({"prompts": prompts}),
+                        "done": True, "load_duration": int(load_duration * 1e9)})
+
+    def write_chunk(self, payload):
+        line = json.dumps(payload).encode("utf-8") + b"\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+
+class FakeImageGenerator:
+    """Stands in for bing_create.ImageGenerator
+
+    Sleeps for the configured render time, fails at the configured rate with
+    an error the scheduler treats as throttling, and returns URLs served by
+    the fake Bing server.
+    """
+
+    def __init__(self, image_base_url, latency=0.5, failure_rate=0.0, seed=0):
+        self.image_base_url = image_base_url
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.ids = iter(range(1, 1 << 30))
+
+    def generate(self, prompt, num_images):
+        time.sleep(self.latency)
+        with self.lock:
+            failed = self.random.random() < self.failure_rate
+            ids = [next(self.ids) for _ in range(num_images)]
+        if failed:
+            raise Exception("Request failed: try again later")
+        return [f"{self.image_base_url}/images/{image_id}.jpg" for image_id in ids]
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"p50": 0.0, "p95": 0.0}
+    return {
+        "p50": app_module.Metrics.percentile(latencies, 0.50),
+        "p95": app_module.Metrics.percentile(latencies, 0.95)
+    }
+
+
+def stage_summary():
+    """Per-stage p50/p95 from the application's own metrics"""
+    stages = {}
+    for (stage, model), (count, total, p50, p95) in app_module.METRICS.summary().items():
+        entry = stages.setdefault(stage, {"count": 0, "p50": 0.0, "p95": 0.0})
+        entry["count"] += count
+        entry["p50"] = max(entry["p50"], p50)
+        entry["p95"] = max(entry["p95"], p95)
+    return stages
+
+
+def median_results(runs):
+    """Combine repeated runs of one benchmark by taking the median of each metric"""
+    combined = {}
+    for key in runs[0]:
+        if key == "stages":
+            # A stage missing from some runs did not happen in them
+            names = sorted({stage for run in runs for stage in run["stages"]})
+            combined[key] = {
+                stage: {
+                    field: statistics.median(run["stages"].get(stage, {}).get(field, 0)
+                                             for run in runs)
+                    for field in ("count", "p50", "p95")
+                }
+                for stage in names
+            }
+        else:
+            combined[key] = statistics.median(run[key] for run in runs)
+    combined["repeats"] = len(runs)
+    return combined
+
+
+def make_scheduler(generator, args, workers):
+    """A scheduler whose pacing and backoff fit benchmark timescales"""
+    return app_module.GenerationScheduler(
+        app_module.CookiePool.single(generator),
+        rate_per_minute=args.rate_per_minute,
+        burst=workers,
+        workers=workers,
+        max_attempts=args.max_attempts,
+        base_backoff=0.05,
+        max_backoff=1.0
+    )
+
+
+def wait_until(app, condition, timeout):
+    """Process Qt events until condition() is true or the timeout passes"""
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        app.processEvents()
+        time.sleep(0.001)
+    return True
+
+
+def bench_gui(app, args, image_base_url):
+    """generate_images -> save_current_image through the real window"""
+    app_module.METRICS.spans.clear()
+    window = app_module.BingImageCreatorGUI()
+    generator = FakeImageGenerator(image_base_url, args.bing_latency, args.bing_failure_rate, args.seed)
+    window.generator = generator
+    window.scheduler = make_scheduler(generator, args, app_module.MAX_CONCURRENT_JOBS)
+    window.u_cookie_input.setText("benchmark")
+    window.srchhpgusr_input.setText("benchmark")
+    window.num_images_spin.setValue(args.num_images)
+    if args.model:
+        window.ollama_combo.addItem(FAKE_MODEL)
+        window.ollama_combo.setCurrentText(FAKE_MODEL)
+    window.stream_checkbox.setChecked(args.stream)
+    # The fake CDN serves the same picture under every URL; hash it, but
+    # save it anyway
+    window.skip_duplicates_checkbox.setChecked(False)
+    window.show()
+    if args.model:
+        # Like a user picking the model before typing, let the warm-up finish
+        wait_until(app, lambda: window.model_is_loaded(FAKE_MODEL), args.timeout)
+
+    latencies = []
+    failures = 0
+    started = time.perf_counter()
+    for iteration in range(args.iterations):
+        window.phrase_input.setText(f"benchmark phrase {iteration:04d}")
+        iteration_started = time.perf_counter()
+        window.generate_images()
+        job = window.jobs[-1]
+
+        def image_ready():
+            # Every iteration should reach Bing, so turn down offers of
+            # earlier results like a user would
+            if job.state == "offered":
+                window.job_list.setCurrentItem(job.list_item)
+                window.generate_anyway_btn.click()
+            # Finished jobs are only shown automatically while the previous
+            # result is not being viewed, so select it like a user would
+            if job.state == "done" and window.displayed_job is not job:
+                window.job_list.setCurrentItem(job.list_item)
+            return job.state in ("failed", "cancelled") or (
+                window.displayed_job is job and window.current_image_data is not None
+            )
+        if not wait_until(app, image_ready, args.timeout) or job.state != "done":
+            failures += 1
+            continue
+        window.save_current_image()
+        # Saves run in the background; the round trip ends once it is on disk
+        wait_until(app, lambda: not window.save_threads, args.timeout)
+        latencies.append(time.perf_counter() - iteration_started)
+    elapsed = time.perf_counter() - started
+    window.close()
+
+    return dict(
+        summarize(latencies),
+        iterations=args.iterations,
+        failures=failures,
+        seconds=elapsed,
+        throughput=len(latencies) / elapsed if elapsed else 0.0,
+        stages=stage_summary()
+    )
+
+
+def bench_batch(args, image_base_url, output_dir):
+    """N phrases through the headless batch pipeline"""
+    app_module.METRICS.spans.clear()
+    generator = FakeImageGenerator(image_base_url, args.bing_latency, args.bing_failure_rate, args.seed)
+    scheduler = make_scheduler(generator, args, args.generate_workers)
+    pipeline = app_module.BatchPipeline(
+        scheduler,
+        model=FAKE_MODEL if args.model else app_module.DIRECT_PROMPT_MODEL,
+        num_images=args.num_images,
+        workers={"generate": args.generate_workers},
+        output_dir=output_dir,
+        prompt_cache=app_module.PromptCache(Path(output_dir) / ".cache" / "prompt_cache.db"),
+        prompt_chunk_size=args.prompt_chunk_size,
+        skip_duplicates=False
+    )
+    rows = [
+        {"phrase": f"batch phrase {n:04d}", "style": "photorealistic", "additional_info": ""}
+        for n in range(args.phrases)
+    ]
+    started = time.perf_counter()
+    # The pipeline reports every saved file; keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = pipeline.run(rows)
+    elapsed = time.perf_counter() - started
+
+    saved = stats["save"].items
+    return dict(
+        phrases=args.phrases,
+        images_saved=saved,
+        failures=args.phrases * args.num_images - saved,
+        seconds=elapsed,
+        throughput=saved / elapsed if elapsed else 0.0,
+        stages=stage_summary()
+    )
+
+
+def regressions(results, baseline, tolerance, min_delta=0.002):
+    """List the metrics that got worse than the baseline by more than tolerance
+
+    Latencies are compared at p50: a p95 of a few dozen samples is decided
+    by one or two slow iterations. Changes below min_delta seconds are
+    ignored, so sub-millisecond stages like log writes do not fail the
+    comparison on timer noise.
+    """
+    found = []
+
+    def check(name, current, previous, higher_is_better=False, floor=0.0):
+        if current is None or not previous or abs(current - previous) < floor:
+            return
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        if worse > tolerance:
+            found.append(f"{name}: {previous:.4f} -> {current:.4f} ({change:+.0%})")
+
+    for bench in ("gui", "batch"):
+        if bench not in results or bench not in baseline:
+            continue
+        current, previous = results[bench], baseline[bench]
+        check(f"{bench} throughput", current["throughput"], previous.get("throughput"), True)
+        if "p50" in current:
+            check(f"{bench} p50 latency", current["p50"], previous.get("p50"), floor=min_delta)
+        for stage, stats in current["stages"].items():
+            previous_stage = previous.get("stages", {}).get(stage)
+            if previous_stage:
+                check(f"{bench} {stage} p50", stats["p50"], previous_stage.get("p50"), floor=min_delta)
+    check("peak RSS MB", results.get("peak_rss_mb"), baseline.get("peak_rss_mb"))
+    return found
+
+
+def print_results(results):
+    if "gui" in results:
+        gui = results["gui"]
+        print(f"GUI   {gui['iterations']} iteration(s) in {gui['seconds']:.2f}s "
+              f"(median of {gui['repeats']}): "
+              f"{gui['throughput']:.2f} saves/s, p50 {gui['p50'] * 1000:.0f}ms, "
+              f"p95 {gui['p95'] * 1000:.0f}ms, {gui['failures']} failed")
+    if "batch" in results:
+        batch = results["batch"]
+        print(f"Batch {batch['phrases']} phrase(s) in {batch['seconds']:.2f}s "
+              f"(median of {batch['repeats']}): "
+              f"{batch['throughput']:.2f} images/s, {batch['images_saved']} saved, "
+              f"{batch['failures']} failed")
+    for bench in ("gui", "batch"):
+        for stage, stats in sorted(results.get(bench, {}).get("stages", {}).items()):
+            print(f"  {bench:<5} {stage:<20} n={stats['count']:<5} "
+                  f"p50={stats['p50'] * 1000:8.1f}ms p95={stats['p95'] * 1000:8.1f}ms")
+    if results.get("peak_rss_mb") is not None:
+        print(f"Peak RSS: {results['peak_rss_mb']:.1f} MB")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark Bing Image Creator GUI against local fakes")
+    parser.add_argument("--only", choices=("gui", "batch"), help="Run a single benchmark")
+    parser.add_argument("--iterations", type=int, default=30,
+                        help="generate -> save round trips in the GUI benchmark")
+    parser.add_argument("--phrases", type=int, default=40, help="Phrases in the batch benchmark")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="Runs of each benchmark; the median of every metric is reported")
+    parser.add_argument("--num-images", type=int, default=2, choices=range(1, 5))
+    parser.add_argument("--model", action="store_true",
+                        help="Generate prompts with the fake Ollama instead of direct prompts")
+    parser.add_argument("--stream", action="store_true", help="Stream prompts in the GUI benchmark")
+    parser.add_argument("--generate-workers", type=int, default=4)
+    parser.add_argument("--rate-per-minute", type=float, default=6000)
+    parser.add_argument("--max-attempts", type=int, default=4)
+    parser.add_argument("--bing-latency", type=float, default=0.2,
+                        help="Seconds the fake Bing takes to render a prompt")
+    parser.add_argument("--bing-failure-rate", type=float, default=0.0)
+    parser.add_argument("--cdn-latency", type=float, default=0.01,
+                        help="Seconds the fake CDN takes to serve an image")
+    parser.add_argument("--cdn-failure-rate", type=float, default=0.0)
+    parser.add_argument("--image-size", type=int, default=1024, help="Width and height of served images")
+    parser.add_argument("--ollama-latency", type=float, default=0.05)
+    parser.add_argument("--ollama-failure-rate", type=float, default=0.0)
+    parser.add_argument("--ollama-drop-rate", type=float, default=0.0,
+                        help="Fraction of entries the fake Ollama leaves out of batched answers")
+    parser.add_argument("--prompt-chunk-size", type=int, default=1,
+                        help="Phrases per Ollama request in the batch benchmark")
+    parser.add_argument("--ollama-load-time", type=float, default=1.0,
+                        help="Seconds the fake Ollama takes to load a model on first use")
+    parser.add_argument("--token-delay", type=float, default=0.002,
+                        help="Seconds per generated token of the fake Ollama")
+    parser.add_argument("--tokens", type=int, default=40, help="Tokens per fake Ollama response")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60, help="Per-iteration timeout in seconds")
+    parser.add_argument("--baseline", default=str(BASELINE_FILE))
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store the results as the new baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative regression before failing")
+    parser.add_argument("--min-delta", type=float, default=0.002,
+                        help="Ignore latency changes smaller than this many seconds")
+    parser.add_argument("--json-out", metavar="FILE", help="Also write the results to FILE")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    app = QApplication(sys.argv[:1])
+
+    bing = FakeServer(FakeBingHandler, args.cdn_latency, args.cdn_failure_rate, args.seed)
+    bing.image = make_jpeg(args.image_size, args.image_size, args.seed)
+    ollama = FakeServer(FakeOllamaHandler, args.ollama_latency, args.ollama_failure_rate, args.seed)
+    ollama.token_delay = args.token_delay
+    ollama.tokens = args.tokens
+    ollama.load_time = args.ollama_load_time
+    ollama.drop_rate = args.ollama_drop_rate
+    ollama.loaded_models = set()
+    bing.start()
+    ollama.start()
+    app_module.OLLAMA_URL = ollama.url
+
+    results = {"settings": {key: value for key, value in vars(args).items()
+                            if key not in ("baseline", "save_baseline", "json_out", "only",
+                                           "tolerance", "min_delta")}}
+    # The application writes Output/ relative to the working directory; each
+    # run starts from an empty one
+    previous_cwd = os.getcwd()
+    runs = {"gui": [], "batch": []}
+    for _ in range(max(args.repeats, 1)):
+        with tempfile.TemporaryDirectory(prefix="bing-benchmark-") as workdir:
+            os.chdir(workdir)
+            try:
+                if args.only in (None, "gui"):
+                    runs["gui"].append(bench_gui(app, args, bing.url))
+                if args.only in (None, "batch"):
+                    runs["batch"].append(bench_batch(args, bing.url, Path(workdir) / "batch"))
+            finally:
+                os.chdir(previous_cwd)
+        # Later repeats keep memory of the earlier ones, so the peak is
+        # taken after the first
+        if "peak_rss_mb" not in results:
+            results["peak_rss_mb"] = peak_rss_mb()
+    for bench, bench_runs in runs.items():
+        if bench_runs:
+            results[bench] = median_results(bench_runs)
+    bing.stop()
+    ollama.stop()
+
+    print_results(results)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"[INFO] Saved baseline to {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"[INFO] No baseline at {baseline_path}; run with --save-baseline to create one")
+        return 0
+
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("settings") != results["settings"]:
+        print("[INFO] Settings differ from the baseline; comparison may not be meaningful")
+    found = regressions(results, baseline, args.tolerance, args.min_delta)
+    if found:
+        print(f"[ERROR] Regressions beyond {args.tolerance:.0%} of {baseline_path}:")
+        for line in found:
+            print(f"  {line}")
+        return 1
+    print(f"[INFO] No regressions beyond {args.tolerance:.0%} of {baseline_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
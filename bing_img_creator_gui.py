@@ -1,70 +1,2941 @@
+import time
+_MODULE_START = time.perf_counter()
+
 import sys
 import os
+import re
+import csv
 import json
-import requests
+import io
+import math
+import heapq
+import queue
+import random
+import itertools
+import argparse
+import sqlite3
+import threading
+import hashlib
+import importlib.util
+import multiprocessing
+import unicodedata
+from collections import deque, OrderedDict
+from concurrent.futures import (Future, InvalidStateError, ProcessPoolExecutor, ThreadPoolExecutor,
+                                wait as wait_futures)
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack, contextmanager
+from functools import partial
 from pathlib import Path
 from datetime import datetime
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLabel, QLineEdit, QPushButton, 
-                             QTextEdit, QComboBox, QSpinBox, QGroupBox)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
-from PyQt6.QtGui import QPixmap
-from bing_create.main import ImageGenerator
+                             QTextEdit, QComboBox, QSpinBox, QGroupBox, QCheckBox,
+                             QTableWidget, QTableWidgetItem, QHeaderView, QFileDialog,
+                             QListWidget, QListWidgetItem, QListView)
+from PyQt6.QtCore import (Qt, QAbstractListModel, QBuffer, QByteArray, QIODevice, QModelIndex,
+                          QObject, QRunnable, QSize, QThread, QThreadPool, QTimer, QUrl, pyqtSignal)
+from PyQt6.QtGui import QDesktopServices, QImage, QImageReader, QPixmap, QTextCursor
+
+# requests and bing_create are imported on first use (see load_requests and
+# load_image_generator) so the window can paint before they are loaded
+
+_MODULE_IMPORTED = time.perf_counter()
+
+# Style categories from the provided list
+STYLE_CATEGORIES = {
+    "Photographic & Realistic": [
+        "Photorealistic",
+        "Cinematic Film Still",
+        "Analog Film (35mm / Kodak / Fujifilm)",
+        "Film Noir",
+        "Portrait Photography",
+        "Food Photography",
+        "Macro Photography",
+        "Street Photography",
+        "Old Photograph BW",
+        "Old Photograph Colorized"
+    ],
+    "Artistic & Painting": [
+        "Oil Painting",
+        "Watercolor",
+        "BW Pencil Sketch",
+        "Color Pencil Sketch",
+        "BW Charcoal Drawing",
+        "Color Charcoal Drawing",
+        "Digital Painting",
+        "Surrealism",
+        "Impressionism"
+    ],
+    "Graphic & Stylized": [
+        "Illustration",
+        "Anime",
+        "Comic Book",
+        "Graphic Novel",
+        "Pixel Art",
+        "Vector Graphics",
+        "Flat Design"
+    ],
+    "3D & Rendering": [
+        "3D Rendering",
+        "Octane Render / Unreal Engine",
+        "Lowpoly",
+        "Isometric",
+        "Blender Render"
+    ],
+    "Genre & Aesthetic": [
+        "Cyberpunk",
+        "Neonpunk",
+        "Steampunk",
+        "Fantasy",
+        "Sci-Fi",
+        "Art Deco",
+        "Art Nouveau",
+        "Minimalist",
+        "Vintage / Retro",
+        "Concept Art"
+    ]
+}
+
+OLLAMA_URL = "http://localhost:11434"
+# How long Ollama keeps a model loaded after our last request; batch mode
+# replaces this with an estimate of the batch duration
+OLLAMA_KEEP_ALIVE = "30m"
+# Requests whose model load took at least this long count as cold starts
+OLLAMA_COLD_LOAD_SECONDS = 0.5
+DIRECT_PROMPT_MODEL = "None (Direct prompt)"
+OUTPUT_DIR = Path("Output")
+ACCOUNTS_FILE = Path("bing_accounts.json")
+CACHE_DIR = OUTPUT_DIR / ".cache"
+# Images whose 64-bit dHashes differ in at most this many bits are treated
+# as near-duplicates
+DEDUP_MAX_DISTANCE = 6
+# Ollama model for the similar-images index; without it a local hashing
+# embedder is used
+EMBEDDING_MODEL = "nomic-embed-text"
+# Saved images offered before a generation
+SIMILAR_IMAGES_K = 4
+# Longest side of gallery thumbnails in pixels
+THUMBNAIL_SIZE = 160
+# Optional post-processing (needs Pillow): JPEG quality of re-encoded
+# images, and the longest side in pixels and DPI of each size variant.
+# Variants are never larger than their source
+JPEG_QUALITY = 90
+POSTPROCESS_VARIANTS = {
+    "web": (768, 72),
+    "print": (2048, 300)
+}
+
+
+# Startup timings are collected only when --profile-startup is given
+_startup_timings = None
+_startup_reported = False
+
+
+def record_startup(label, seconds):
+    """Record a startup timing, printing it directly if the report is out"""
+    if _startup_timings is None:
+        return
+    _startup_timings.append((label, seconds))
+    if _startup_reported:
+        print(f"[PROFILE] {label:<32} {seconds * 1000:9.1f} ms (background)", file=sys.stderr)
+
+
+@contextmanager
+def startup_step(label):
+    """Time a block of startup work for --profile-startup"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_startup(label, time.perf_counter() - started)
+
+
+def report_startup():
+    """Print the collected startup timings"""
+    global _startup_reported
+    _startup_reported = True
+    print("[PROFILE] Startup timings:", file=sys.stderr)
+    for label, seconds in _startup_timings:
+        print(f"[PROFILE] {label:<32} {seconds * 1000:9.1f} ms", file=sys.stderr)
+    total = time.perf_counter() - _MODULE_START
+    print(f"[PROFILE] {'time to first window':<32} {total * 1000:9.1f} ms", file=sys.stderr)
+
+
+class Metrics:
+    """Collects timed spans for each pipeline stage
+    
+    Spans are kept in a bounded ring buffer. They can be summarized as
+    p50/p95 latencies per (stage, model) and exported as a Chrome trace
+    (chrome://tracing, Perfetto) or a Prometheus text file.
+    """
+    
+    def __init__(self, max_spans=20000):
+        self.spans = deque(maxlen=max_spans)
+        self.lock = threading.Lock()
+    
+    @contextmanager
+    def span(self, stage, **labels):
+        """Time a block of work as one span of the given stage"""
+        wall_start = time.time()
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.record(stage, wall_start, time.perf_counter() - started, **labels)
+    
+    def record(self, stage, wall_start, duration, **labels):
+        with self.lock:
+            self.spans.append((stage, labels, wall_start, duration, threading.get_ident()))
+    
+    @staticmethod
+    def percentile(sorted_values, fraction):
+        """Nearest-rank percentile of an already sorted list"""
+        index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+        return sorted_values[index]
+    
+    def summary(self):
+        """Return {(stage, model): (count, total, p50, p95)} in seconds"""
+        with self.lock:
+            spans = list(self.spans)
+        groups = {}
+        for stage, labels, _, duration, _ in spans:
+            groups.setdefault((stage, labels.get("model", "")), []).append(duration)
+        result = {}
+        for key, durations in sorted(groups.items()):
+            durations.sort()
+            result[key] = (
+                len(durations),
+                sum(durations),
+                self.percentile(durations, 0.50),
+                self.percentile(durations, 0.95)
+            )
+        return result
+    
+    def chrome_trace(self):
+        """Return the spans in Chrome trace event format"""
+        with self.lock:
+            spans = list(self.spans)
+        events = []
+        for stage, labels, wall_start, duration, thread_id in spans:
+            events.append({
+                "name": stage,
+                "cat": "pipeline",
+                "ph": "X",
+                "ts": int(wall_start * 1e6),
+                "dur": int(duration * 1e6),
+                "pid": os.getpid(),
+                "tid": thread_id,
+                "args": labels
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+    
+    def prometheus_text(self):
+        """Return the latency summaries in Prometheus text exposition format"""
+        lines = [
+            "# HELP bing_gui_stage_seconds Latency of pipeline stages in seconds",
+            "# TYPE bing_gui_stage_seconds summary"
+        ]
+        for (stage, model), (count, total, p50, p95) in self.summary().items():
+            labels = f'stage="{stage}"'
+            if model:
+                labels += ',model="{}"'.format(model.replace("\\", "\\\\").replace('"', '\\"'))
+            lines.append(f'bing_gui_stage_seconds{{{labels},quantile="0.5"}} {p50:.6f}')
+            lines.append(f'bing_gui_stage_seconds{{{labels},quantile="0.95"}} {p95:.6f}')
+            lines.append(f"bing_gui_stage_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"bing_gui_stage_seconds_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+    
+    def export_chrome_trace(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+    
+    def export_prometheus(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+    
+    def summary_lines(self):
+        """Return the latency summary as printable lines"""
+        lines = []
+        for (stage, model), (count, _, p50, p95) in self.summary().items():
+            name = f"{stage} [{model}]" if model else stage
+            lines.append(f"{name:<36} n={count:<6} p50={p50 * 1000:9.1f} ms p95={p95 * 1000:9.1f} ms")
+        return lines
+
+
+METRICS = Metrics()
+
+
+_import_lock = threading.Lock()
+_requests_module = None
+_image_generator_class = None
+
+
+def load_requests():
+    """Import requests on first use"""
+    global _requests_module
+    with _import_lock:
+        if _requests_module is None:
+            with startup_step("import requests"):
+                import requests
+            _requests_module = requests
+    return _requests_module
+
+
+def load_image_generator():
+    """Import bing_create's ImageGenerator on first use"""
+    global _image_generator_class
+    with _import_lock:
+        if _image_generator_class is None:
+            with startup_step("import bing_create"):
+                from bing_create.main import ImageGenerator
+            _image_generator_class = ImageGenerator
+    return _image_generator_class
+
+
+class HttpClient:
+    """Shared HTTP client for Ollama and image CDN traffic
+    
+    One requests.Session keeps a keep-alive connection pool per host
+    (pool_connections hosts, pool_maxsize connections each) with a retry
+    policy for idempotent requests. Image downloads can optionally go
+    through an HTTP/2 httpx client when the h2 package is installed.
+    """
+    
+    def __init__(self, pool_connections=8, pool_maxsize=8, timeout=(5, 30),
+                 retries=2, backoff_factor=0.5, http2=False):
+        requests = load_requests()
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "HEAD"})
+        )
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                              max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.adapter = adapter
+        
+        self.http2_client = None
+        self.http2_requests = 0
+        if http2:
+            try:
+                import httpx
+                import h2  # noqa: F401 - httpx only checks for it on first request
+                limits = httpx.Limits(max_connections=pool_connections * pool_maxsize,
+                                      max_keepalive_connections=pool_maxsize)
+                self.http2_client = httpx.Client(
+                    timeout=httpx.Timeout(timeout[1], connect=timeout[0]),
+                    transport=httpx.HTTPTransport(http2=True, retries=retries, limits=limits)
+                )
+            except ImportError:
+                print("[ERROR] HTTP/2 requires 'httpx[http2]', falling back to HTTP/1.1", file=sys.stderr)
+    
+    def get(self, url, timeout=None, **kwargs):
+        return self.session.get(url, timeout=timeout or self.timeout, **kwargs)
+    
+    def post(self, url, timeout=None, **kwargs):
+        return self.session.post(url, timeout=timeout or self.timeout, **kwargs)
+    
+    def get_bytes(self, url, timeout=None):
+        """Download a binary resource such as an image from the CDN"""
+        with METRICS.span("image_download"):
+            if self.http2_client is not None:
+                self.http2_requests += 1
+                response = self.http2_client.get(url, timeout=timeout or self.timeout[1])
+            else:
+                response = self.get(url, timeout=timeout)
+            response.raise_for_status()
+            return response.content
+    
+    def stats(self):
+        """Return request/connection counters summed over the live host pools"""
+        pools = self.adapter.poolmanager.pools
+        requests_made = connections = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                requests_made += pool.num_requests
+                connections += pool.num_connections
+        return {
+            "requests": requests_made,
+            "connections": connections,
+            "reused": max(requests_made - connections, 0),
+            "http2_requests": self.http2_requests
+        }
+    
+    def stats_text(self):
+        stats = self.stats()
+        return f"HTTP: {stats['requests']} req / {stats['connections']} conn ({stats['reused']} reused)"
+
+
+_http_client = None
+_http_client_settings = {}
+_http_client_lock = threading.Lock()
+
+
+def configure_http_client(**kwargs):
+    """Set the shared HTTP client's options; it is created on first use"""
+    global _http_client, _http_client_settings
+    with _http_client_lock:
+        _http_client_settings = kwargs
+        _http_client = None
+
+
+def get_http_client():
+    """Return the shared HTTP client, creating it if needed"""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = HttpClient(**_http_client_settings)
+        return _http_client
+
+
+def build_base_prompt(phrase, additional_info=""):
+    """Combine the phrase and optional additional info into the base prompt"""
+    if additional_info:
+        return f"{phrase}. Additional context: {additional_info}"
+    return phrase
+
+
+def direct_prompt(phrase, style, additional_info=""):
+    """Build the prompt used when no Ollama model is selected"""
+    return f"{build_base_prompt(phrase, additional_info)}, {style}"
+
+
+def build_ollama_instruction(phrase, style, additional_info=""):
+    """Build the instruction text sent to Ollama for prompt generation"""
+    base_prompt = build_base_prompt(phrase, additional_info)
+    return f"Create a detailed image generation prompt for: '{base_prompt}' in {style} style. Only respond with the prompt, no explanations."
+
+
+def build_ollama_batch_instruction(items):
+    """Build one instruction asking Ollama for a prompt per (phrase, style, additional_info)"""
+    lines = [
+        "Create a detailed image generation prompt for each numbered entry below.",
+        'Respond only with JSON of the form {"prompts": [{"id": 1, "prompt": "..."}]}, '
+        "with one object per entry and no explanations."
+    ]
+    for number, (phrase, style, additional_info) in enumerate(items, 1):
+        lines.append(f"{number}. '{build_base_prompt(phrase, additional_info)}' in {style} style")
+    return "\n".join(lines)
+
+
+def parse_batch_prompts(text, count):
+    """Parse Ollama's JSON answer to a batch instruction
+    
+    Returns a list of count prompts in entry order, with None for entries
+    that are missing, duplicated or not a non-empty string.
+    """
+    prompts = [None] * count
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return prompts
+    entries = data.get("prompts") if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        return prompts
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            index = int(entry.get("id")) - 1
+        except (TypeError, ValueError):
+            continue
+        prompt = entry.get("prompt")
+        if 0 <= index < count and prompts[index] is None and isinstance(prompt, str) and prompt.strip():
+            prompts[index] = prompt.strip()
+    return prompts
+
+
+def keep_alive_seconds(keep_alive):
+    """Convert an Ollama keep_alive value ("30m", "1h", 300, -1) to seconds
+    
+    Returns None when the model is kept loaded indefinitely.
+    """
+    if isinstance(keep_alive, (int, float)):
+        return None if keep_alive < 0 else float(keep_alive)
+    match = re.fullmatch(r"\s*(-?\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*", str(keep_alive))
+    if not match:
+        raise ValueError(f"Invalid keep-alive duration: {keep_alive!r}")
+    value = float(match.group(1))
+    if value < 0:
+        return None
+    return value * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[match.group(2) or "s"]
+
+
+def record_ollama_latency(model, wall_start, duration, load_duration_ns,
+                          stage="ollama_prompt", **labels):
+    """Record a prompt request, keeping cold starts apart from warm requests"""
+    cold = (load_duration_ns or 0) / 1e9 >= OLLAMA_COLD_LOAD_SECONDS
+    METRICS.record(f"{stage}_cold" if cold else stage, wall_start, duration, model=model, **labels)
+
+
+def ollama_load_model(model, keep_alive=None, timeout=300):
+    """Load a model into Ollama's memory without generating anything
+    
+    Also refreshes how long the model stays loaded. Returns the seconds the
+    request took, which is close to zero when the model was already loaded.
+    """
+    with METRICS.span("ollama_load", model=model):
+        started = time.perf_counter()
+        response = get_http_client().post(
+            f"{OLLAMA_URL}/api/generate",
+            json={
+                "model": model,
+                "keep_alive": OLLAMA_KEEP_ALIVE if keep_alive is None else keep_alive
+            },
+            timeout=timeout
+        )
+        elapsed = time.perf_counter() - started
+    if response.status_code != 200:
+        raise RuntimeError(f"Ollama returned HTTP {response.status_code}")
+    return elapsed
+
+
+def ollama_embed(model, texts, timeout=60):
+    """Return one embedding per text from Ollama's embed endpoint"""
+    with METRICS.span("ollama_embed", model=model):
+        response = get_http_client().post(
+            f"{OLLAMA_URL}/api/embed",
+            json={"model": model, "input": texts, "keep_alive": OLLAMA_KEEP_ALIVE},
+            timeout=timeout
+        )
+    if response.status_code != 200:
+        raise RuntimeError(f"Ollama returned HTTP {response.status_code}")
+    return response.json()["embeddings"]
+
+
+def ollama_generate_prompt(model, phrase, style, additional_info="", timeout=30):
+    """Generate an enhanced prompt with Ollama, raising on failure"""
+    wall_start = time.time()
+    started = time.perf_counter()
+    response = get_http_client().post(
+        f"{OLLAMA_URL}/api/generate",
+        json={
+            "model": model,
+            "prompt": build_ollama_instruction(phrase, style, additional_info),
+            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE
+        },
+        timeout=timeout
+    )
+    duration = time.perf_counter() - started
+    if response.status_code != 200:
+        METRICS.record("ollama_prompt", wall_start, duration, model=model)
+        raise RuntimeError(f"Ollama returned HTTP {response.status_code}")
+    result = response.json()
+    record_ollama_latency(model, wall_start, duration, result.get("load_duration"))
+    return result.get("response", "").strip()
+
+
+def ollama_generate_prompts(model, items, timeout=120):
+    """Generate prompts for several (phrase, style, additional_info) items in one request
+    
+    Uses Ollama's JSON output mode. Returns one prompt per item, with None
+    for entries the model left out or garbled; raises on request failure.
+    """
+    wall_start = time.time()
+    started = time.perf_counter()
+    response = get_http_client().post(
+        f"{OLLAMA_URL}/api/generate",
+        json={
+            "model": model,
+            "prompt": build_ollama_batch_instruction(items),
+            "format": "json",
+            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE
+        },
+        timeout=timeout
+    )
+    duration = time.perf_counter() - started
+    if response.status_code != 200:
+        METRICS.record("ollama_prompt_batch", wall_start, duration, model=model)
+        raise RuntimeError(f"Ollama returned HTTP {response.status_code}")
+    result = response.json()
+    record_ollama_latency(model, wall_start, duration, result.get("load_duration"),
+                          stage="ollama_prompt_batch", items=len(items))
+    return parse_batch_prompts(result.get("response", ""), len(items))
+
+
+def ollama_stream_prompt(model, phrase, style, additional_info="", on_token=None,
+                         should_stop=None, max_tokens=0, deadline=None, timeout=30):
+    """Stream a prompt from Ollama chunk by chunk
+    
+    Returns (text, reason) where reason is "done", "cancelled", "max_tokens"
+    or "deadline". deadline is an absolute time.monotonic() value, or a
+    callable returning one (or None) so it can be set while streaming.
+    """
+    payload = {
+        "model": model,
+        "prompt": build_ollama_instruction(phrase, style, additional_info),
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE
+    }
+    if max_tokens:
+        payload["options"] = {"num_predict": max_tokens}
+    
+    chunks = []
+    reason = "done"
+    tokens = 0
+    # Only the final chunk reports the load time; stopped streams count as warm
+    load_duration = None
+    wall_start = time.time()
+    started = time.perf_counter()
+    try:
+        with get_http_client().post(f"{OLLAMA_URL}/api/generate", json=payload, stream=True,
+                                    timeout=timeout) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"Ollama returned HTTP {response.status_code}")
+            
+            for line in response.iter_lines():
+                if should_stop and should_stop():
+                    reason = "cancelled"
+                    break
+                current_deadline = deadline() if callable(deadline) else deadline
+                if current_deadline is not None and time.monotonic() > current_deadline:
+                    reason = "deadline"
+                    break
+                if not line:
+                    continue
+                
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise RuntimeError(chunk["error"])
+                token = chunk.get("response", "")
+                if token:
+                    chunks.append(token)
+                    tokens += 1
+                    if on_token:
+                        on_token(token)
+                if chunk.get("done"):
+                    load_duration = chunk.get("load_duration")
+                    break
+                if max_tokens and tokens >= max_tokens:
+                    reason = "max_tokens"
+                    break
+    finally:
+        record_ollama_latency(model, wall_start, time.perf_counter() - started, load_duration,
+                              stream=True)
+    return "".join(chunks).strip(), reason
+
+
+def extract_image_urls(images):
+    """Extract image URLs from an ImageGenerator.generate response"""
+    image_urls = []
+    if isinstance(images, list):
+        for img in images:
+            if isinstance(img, dict) and 'url' in img:
+                image_urls.append(img['url'])
+            elif isinstance(img, str):
+                image_urls.append(img)
+    return image_urls
+
+
+def output_basename(phrase, style):
+    """Format the phrase_style part of an output filename (phrase_style_0001.jpg)"""
+    phrase = unicodedata.normalize("NFC", phrase).replace(" ", "_")
+    style = style.replace(" ", "_").replace("/", "-")
+    return f"{phrase}_{style}"
+
+
+def atomic_write(path, data):
+    """Write bytes to path so readers only ever see the complete file
+    
+    The data goes to a hidden temporary file in the same directory, is
+    flushed to disk and then renamed over the target.
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+class OutputCatalog:
+    """Persistent catalog of the Output directory for filename allocation
+    
+    Tracks the highest counter used per phrase_style base name so the next
+    filename is allocated with a dictionary lookup instead of a directory
+    scan. The catalog is synced with the directory by comparing its mtime
+    and only parsing names it has not seen; if the database is lost it is
+    rebuilt with a single scan. The app's own writes go through writing()
+    so that the mtime changes they cause do not trigger a rescan. Keys are
+    NFC-normalized and casefolded so differently composed Greek names and
+    case-insensitive filesystems cannot produce collisions.
+    """
+    FILENAME_RE = re.compile(r"^(?P<base>.+)_(?P<counter>\d{4,})\.jpg$", re.IGNORECASE)
+    
+    def __init__(self, output_dir=OUTPUT_DIR, path=None):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.path = Path(path) if path else self.output_dir / ".cache" / "catalog.db"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        # Writes into output_dir in progress; the directory is not rescanned
+        # while the app itself is changing it
+        self.writers = 0
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, counter INTEGER NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.files = {row[0] for row in self.conn.execute("SELECT name FROM files")}
+        self.counters = dict(self.conn.execute("SELECT key, counter FROM counters"))
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'dir_mtime'").fetchone()
+        self.dir_mtime = int(row[0]) if row else None
+        self.refresh()
+    
+    @staticmethod
+    def make_key(base):
+        return unicodedata.normalize("NFC", base).casefold()
+    
+    def refresh(self):
+        """Pick up files added or removed outside the app since the last sync"""
+        with self.lock:
+            mtime = self.output_dir.stat().st_mtime_ns
+            # allocate() checks each name against the disk, so skipping the
+            # scan during the app's own writes cannot reuse a filename
+            if mtime == self.dir_mtime or self.writers:
+                return
+            
+            on_disk = {entry.name for entry in os.scandir(self.output_dir) if entry.is_file()}
+            added = on_disk - self.files
+            removed = self.files - on_disk
+            updated = {}
+            for name in added:
+                match = self.FILENAME_RE.match(unicodedata.normalize("NFC", name))
+                if match:
+                    key = self.make_key(match.group("base"))
+                    counter = int(match.group("counter"))
+                    if counter > self.counters.get(key, 0):
+                        self.counters[key] = counter
+                        updated[key] = counter
+            self.files = on_disk
+            self.dir_mtime = mtime
+            
+            # Counters are never lowered for removed files so names stay unique
+            with self.conn:
+                self.conn.executemany("INSERT OR IGNORE INTO files (name) VALUES (?)", [(n,) for n in added])
+                self.conn.executemany("DELETE FROM files WHERE name = ?", [(n,) for n in removed])
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO counters (key, counter) VALUES (?, ?)", updated.items()
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('dir_mtime', ?)", (str(mtime),)
+                )
+    
+    def allocate(self, phrase, style):
+        """Reserve and return the next unused filename for (phrase, style)"""
+        self.refresh()
+        base = output_basename(phrase, style)
+        key = self.make_key(base)
+        with self.lock:
+            counter = self.counters.get(key, 0) + 1
+            filename = f"{base}_{counter:04d}.jpg"
+            # Guard against files written since the last sync
+            while (self.output_dir / filename).exists():
+                counter += 1
+                filename = f"{base}_{counter:04d}.jpg"
+            self.counters[key] = counter
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO counters (key, counter) VALUES (?, ?)", (key, counter)
+                )
+        return filename
+    
+    @contextmanager
+    def writing(self):
+        """Wrap a write of the app into output_dir
+        
+        Temporary files and renames change the directory mtime; once the
+        last concurrent write is done, the new mtime is taken as synced.
+        """
+        with self.lock:
+            self.writers += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.writers -= 1
+                if not self.writers:
+                    self.dir_mtime = self.output_dir.stat().st_mtime_ns
+    
+    def record(self, *filenames):
+        """Register files written by the app without waiting for a rescan"""
+        with self.lock:
+            self.files.update(filenames)
+            self.dir_mtime = self.output_dir.stat().st_mtime_ns
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO files (name) VALUES (?)", [(n,) for n in filenames]
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('dir_mtime', ?)",
+                    (str(self.dir_mtime),)
+                )
+
+
+def make_log_entry(phrase, style, prompt, filename):
+    """Build a generation log entry"""
+    return {
+        "word_phrase": phrase,
+        "style": style,
+        "ai_generated_prompt": prompt,
+        "date_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "filename": filename
+    }
+
+
+class GenerationLog:
+    """Append-only generation log stored in SQLite (WAL mode)
+    
+    Entries are only ever inserted, in one transaction per batch, so a
+    save costs O(1) regardless of history size and a crash cannot corrupt
+    earlier entries. The legacy generation_log.json array is imported
+    once on first use and left untouched.
+    """
+    COLUMNS = ("word_phrase", "style", "ai_generated_prompt", "date_time", "filename")
+    
+    def __init__(self, path=OUTPUT_DIR / "generation_log.db",
+                 legacy_json=OUTPUT_DIR / "generation_log.json"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " word_phrase TEXT NOT NULL, style TEXT NOT NULL,"
+                " ai_generated_prompt TEXT NOT NULL, date_time TEXT NOT NULL,"
+                " filename TEXT NOT NULL)"
+            )
+            for column in ("word_phrase", "style", "date_time", "filename"):
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS entries_{column} ON entries ({column})")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        if legacy_json is not None:
+            self.migrate_json(Path(legacy_json))
+    
+    def migrate_json(self, legacy_json):
+        """Import the legacy JSON array log once"""
+        with self.lock:
+            done = self.conn.execute(
+                "SELECT value FROM meta WHERE key = 'migrated_json'"
+            ).fetchone()
+        if done or not legacy_json.exists():
+            return 0
+        
+        with open(legacy_json, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO entries (word_phrase, style, ai_generated_prompt, date_time, filename)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [tuple(entry.get(column, "") for column in self.COLUMNS) for entry in entries]
+            )
+            self.conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('migrated_json', ?)", (str(legacy_json),)
+            )
+        return len(entries)
+    
+    def append(self, entries):
+        """Append entries in a single transaction"""
+        with METRICS.span("log_write"), self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO entries (word_phrase, style, ai_generated_prompt, date_time, filename)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [tuple(entry[column] for column in self.COLUMNS) for entry in entries]
+            )
+    
+    @staticmethod
+    def where(phrase=None, style=None, date_from=None, date_to=None, filename=None,
+              before_id=None):
+        """Build the WHERE clause and parameters shared by query() and count()"""
+        clauses = []
+        params = []
+        if phrase:
+            clauses.append("word_phrase >= ? AND word_phrase < ?")
+            params += [phrase, phrase + "\uffff"]
+        if style:
+            clauses.append("style = ?")
+            params.append(style)
+        if date_from:
+            clauses.append("date_time >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("date_time <= ?")
+            params.append(date_to if len(date_to) > 10 else date_to + " 23:59:59")
+        if filename:
+            clauses.append("filename = ?")
+            params.append(filename)
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+    
+    def query(self, phrase=None, style=None, date_from=None, date_to=None, filename=None,
+              limit=None, before_id=None):
+        """Return matching entries, newest first
+        
+        phrase matches as a prefix; dates are "YYYY-MM-DD[ HH:MM:SS]" strings.
+        Entries carry their "id" as well, and before_id continues a listing
+        page by page after the last id seen.
+        """
+        where, params = self.where(phrase, style, date_from, date_to, filename, before_id)
+        sql = ("SELECT id, word_phrase, style, ai_generated_prompt, date_time, filename FROM entries"
+               + where + " ORDER BY id DESC")
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [dict(zip(("id",) + self.COLUMNS, row)) for row in rows]
+    
+    def count(self, **filters):
+        """Count entries, optionally only those matching query() filters"""
+        where, params = self.where(**filters)
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM entries" + where, params).fetchone()[0]
+    
+    def styles(self):
+        """Return the distinct logged styles, sorted"""
+        with self.lock:
+            return [row[0] for row in
+                    self.conn.execute("SELECT DISTINCT style FROM entries ORDER BY style")]
+    
+    def entries_since(self, last_id, limit=256):
+        """Return (id, entry) pairs added after last_id, oldest first"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, word_phrase, style, ai_generated_prompt, date_time, filename FROM entries"
+                " WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, limit)
+            ).fetchall()
+        return [(row[0], dict(zip(self.COLUMNS, row[1:]))) for row in rows]
+
+
+class JobJournal:
+    """Durable record of how far each batch job has progressed (SQLite, WAL)
+    
+    A job is one input row for a given model and image count. Its prompt is
+    recorded once generated, then every image URL Bing returned, and per URL
+    whether it was fetched and under which filename it is being saved. Each
+    step commits on its own, so after a crash or Ctrl-C a rerun continues
+    every job from its last recorded step instead of paying for another
+    generation.
+    """
+    
+    def __init__(self, path=OUTPUT_DIR / "job_journal.db"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " key TEXT PRIMARY KEY, phrase TEXT NOT NULL, style TEXT NOT NULL,"
+                " prompt TEXT, state TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                " key TEXT NOT NULL, position INTEGER NOT NULL, url TEXT NOT NULL,"
+                " state TEXT NOT NULL, filename TEXT,"
+                " PRIMARY KEY (key, url))"
+            )
+    
+    @staticmethod
+    def make_key(model, num_images, phrase, style, additional_info, occurrence=1):
+        """Identify a job; occurrence tells repeated rows of the same input apart"""
+        return json.dumps([
+            model, num_images, unicodedata.normalize("NFC", phrase.strip()), style.strip(),
+            unicodedata.normalize("NFC", additional_info.strip()), occurrence
+        ], ensure_ascii=False)
+    
+    def lookup(self, key):
+        """Return {"state", "prompt", "images": [(url, state, filename)]} or None"""
+        with self.lock:
+            row = self.conn.execute("SELECT state, prompt FROM jobs WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            images = self.conn.execute(
+                "SELECT url, state, filename FROM images WHERE key = ? ORDER BY position", (key,)
+            ).fetchall()
+        return {"state": row[0], "prompt": row[1], "images": images}
+    
+    def set_job(self, key, **fields):
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self.conn.execute(f"UPDATE jobs SET {assignments} WHERE key = ?", (*fields.values(), key))
+    
+    def start(self, key, phrase, style):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO jobs (key, phrase, style, state, updated)"
+                " VALUES (?, ?, ?, 'queued', ?)",
+                (key, phrase, style, time.time())
+            )
+    
+    def prompted(self, key, prompt):
+        with self.lock, self.conn:
+            self.set_job(key, prompt=prompt, state="prompted")
+    
+    def generated(self, key, urls):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO images (key, position, url, state) VALUES (?, ?, ?, 'generated')",
+                [(key, position, url) for position, url in enumerate(urls)]
+            )
+            self.set_job(key, state="generated")
+    
+    def fetched(self, key, url):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE images SET state = 'fetched' WHERE key = ? AND url = ?", (key, url)
+            )
+    
+    def saving(self, key, url, filename):
+        """Note the filename before writing so a crash mid-save is detectable"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE images SET filename = ? WHERE key = ? AND url = ?", (filename, key, url)
+            )
+    
+    def saved(self, key, url):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE images SET state = 'saved' WHERE key = ? AND url = ?", (key, url)
+            )
+            unsaved = self.conn.execute(
+                "SELECT COUNT(*) FROM images WHERE key = ? AND state != 'saved'", (key,)
+            ).fetchone()[0]
+            if not unsaved:
+                self.set_job(key, state="saved")
+    
+    def reset(self, key):
+        """Forget a job so it starts over"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM images WHERE key = ?", (key,))
+            self.conn.execute("DELETE FROM jobs WHERE key = ?", (key,))
+
+
+class PromptCache:
+    """On-disk SQLite cache of generated prompts
+    
+    Keyed by (model, phrase, style, additional_info). Up to max_variants
+    prompts are kept per key and the newest one is served. Entries older
+    than max_age_days or beyond max_entries (least recently used first)
+    are evicted.
+    """
+    
+    def __init__(self, path=CACHE_DIR / "prompt_cache.db", max_variants=3,
+                 max_entries=10000, max_age_days=90):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_variants = max_variants
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS prompts ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " model TEXT NOT NULL, phrase TEXT NOT NULL, style TEXT NOT NULL,"
+                " additional_info TEXT NOT NULL, prompt TEXT NOT NULL,"
+                " created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS prompts_key"
+                " ON prompts (model, phrase, style, additional_info, created)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS prompts_last_used ON prompts (last_used)")
+        self.evict()
+    
+    @staticmethod
+    def make_key(model, phrase, style, additional_info):
+        return (
+            model,
+            unicodedata.normalize("NFC", phrase.strip()),
+            style.strip(),
+            unicodedata.normalize("NFC", additional_info.strip())
+        )
+    
+    def get(self, model, phrase, style, additional_info=""):
+        """Return the newest cached prompt for the key, or None"""
+        key = self.make_key(model, phrase, style, additional_info)
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT id, prompt FROM prompts"
+                " WHERE model = ? AND phrase = ? AND style = ? AND additional_info = ?"
+                " ORDER BY created DESC LIMIT 1",
+                key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE prompts SET last_used = ? WHERE id = ?", (time.time(), row[0]))
+            return row[1]
+    
+    def put(self, model, phrase, style, additional_info, prompt):
+        """Store a prompt variant, keeping only the newest max_variants per key"""
+        key = self.make_key(model, phrase, style, additional_info)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO prompts (model, phrase, style, additional_info, prompt, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                key + (prompt, now, now)
+            )
+            self.conn.execute(
+                "DELETE FROM prompts"
+                " WHERE model = ? AND phrase = ? AND style = ? AND additional_info = ?"
+                " AND id NOT IN (SELECT id FROM prompts"
+                "  WHERE model = ? AND phrase = ? AND style = ? AND additional_info = ?"
+                "  ORDER BY created DESC LIMIT ?)",
+                key + key + (self.max_variants,)
+            )
+    
+    def evict(self):
+        """Drop entries past the age limit and trim to max_entries"""
+        cutoff = time.time() - self.max_age_days * 86400
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM prompts WHERE created < ?", (cutoff,))
+            self.conn.execute(
+                "DELETE FROM prompts WHERE id NOT IN"
+                " (SELECT id FROM prompts ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+    
+    def stats_text(self):
+        total = self.hits + self.misses
+        rate = (100.0 * self.hits / total) if total else 0.0
+        return f"Prompt Cache: {self.hits} hit / {self.misses} miss ({rate:.0f}%)"
+
+
+class ImageCache:
+    """Two-tier image cache for downloaded images
+    
+    The first tier is an in-memory LRU bounded by memory_budget bytes. The
+    second is a content-addressed store on disk: blobs are named by the
+    SHA-256 of their bytes and a small index file per URL points at the
+    blob. The disk tier is bounded by disk_budget bytes; blob mtimes are
+    refreshed on every hit and the least recently used blobs are pruned.
+    Concurrent requests for the same URL share one download.
+    """
+    
+    def __init__(self, directory=CACHE_DIR / "images", memory_budget=64 * 1024 * 1024,
+                 disk_budget=512 * 1024 * 1024, max_workers=4):
+        self.directory = Path(directory)
+        self.blob_dir = self.directory / "blobs"
+        self.url_dir = self.directory / "urls"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.url_dir.mkdir(parents=True, exist_ok=True)
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        # Bytes in blob_dir; counted on the first put rather than at startup
+        self.disk_bytes = None
+        self.prune_lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.hashes = {}
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-prefetch")
+    
+    @staticmethod
+    def url_key(url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+    
+    def remember(self, url, data, content_hash):
+        """Insert into the memory tier, evicting least recently used entries"""
+        with self.lock:
+            self.hashes[url] = content_hash
+            if url in self.memory:
+                self.memory_bytes -= len(self.memory.pop(url))
+            self.memory[url] = data
+            self.memory_bytes += len(data)
+            while self.memory_bytes > self.memory_budget and len(self.memory) > 1:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_bytes -= len(evicted)
+    
+    def get(self, url):
+        """Return cached bytes for the URL from memory or disk, or None"""
+        with self.lock:
+            data = self.memory.get(url)
+            if data is not None:
+                self.memory.move_to_end(url)
+                return data
+        
+        index_file = self.url_dir / self.url_key(url)
+        try:
+            content_hash = index_file.read_text(encoding="ascii").strip()
+            blob = self.blob_dir / content_hash
+            data = blob.read_bytes()
+            # The mtime is the blob's recency for pruning
+            os.utime(blob)
+        except (OSError, ValueError):
+            return None
+        self.remember(url, data, content_hash)
+        return data
+    
+    def put(self, url, data):
+        """Store bytes for the URL in both tiers"""
+        content_hash = hashlib.sha256(data).hexdigest()
+        blob = self.blob_dir / content_hash
+        if blob.exists():
+            os.utime(blob)
+        else:
+            tmp = blob.with_name(f".{content_hash}.{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                tmp.write_bytes(data)
+                os.replace(tmp, blob)
+            except BaseException:
+                tmp.unlink(missing_ok=True)
+                raise
+            self.count_disk_bytes(len(data))
+        (self.url_dir / self.url_key(url)).write_text(content_hash, encoding="ascii")
+        self.remember(url, data, content_hash)
+    
+    def count_disk_bytes(self, added):
+        """Account for a new blob and prune once the disk budget is exceeded"""
+        with self.lock:
+            if self.disk_bytes is None:
+                self.disk_bytes = sum(
+                    entry.stat().st_size for entry in os.scandir(self.blob_dir)
+                    if entry.is_file() and not entry.name.startswith(".")
+                )
+            else:
+                self.disk_bytes += added
+            over = self.disk_bytes > self.disk_budget
+        if over and self.prune_lock.acquire(blocking=False):
+            try:
+                self.prune()
+            finally:
+                self.prune_lock.release()
+    
+    def prune(self, target_fraction=0.9):
+        """Delete least recently used blobs until the tier is below target_fraction of its budget
+        
+        Pruning a little below the budget keeps it from running on every
+        put. URL index files whose blob is gone are deleted too.
+        """
+        blobs = []
+        for entry in os.scandir(self.blob_dir):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                blobs.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        blobs.sort()
+        total = sum(size for _, size, _ in blobs)
+        target = self.disk_budget * target_fraction
+        removed = set()
+        for _, size, path in blobs:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed.add(os.path.basename(path))
+        with self.lock:
+            self.disk_bytes = total
+        if not removed:
+            return
+        for entry in os.scandir(self.url_dir):
+            try:
+                with open(entry.path, "r", encoding="ascii") as f:
+                    if f.read().strip() in removed:
+                        os.remove(entry.path)
+            except (OSError, ValueError):
+                continue
+    
+    def content_hash(self, url):
+        """Return the SHA-256 of a cached URL's bytes, or None if not cached"""
+        with self.lock:
+            content_hash = self.hashes.get(url)
+        if content_hash is None and self.get(url) is not None:
+            with self.lock:
+                content_hash = self.hashes.get(url)
+        return content_hash
+    
+    def download(self, url, token=None):
+        timeout = token.timeout(10) if token is not None else 10
+        return get_http_client().get_bytes(url, timeout=timeout)
+    
+    def fetch(self, url, token=None):
+        """Return the image bytes, downloading at most once per URL"""
+        data = self.get(url)
+        if data is not None:
+            return data
+        
+        if url.startswith("file:"):
+            # Images already saved to Output are read in place, not copied
+            # into the disk tier
+            from urllib.parse import urlparse
+            from urllib.request import url2pathname
+            data = Path(url2pathname(urlparse(url).path)).read_bytes()
+            self.remember(url, data, hashlib.sha256(data).hexdigest())
+            return data
+        
+        with self.lock:
+            future = self.inflight.get(url)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.inflight[url] = future
+        if not owner:
+            # Another thread is downloading the URL; wait in short steps so
+            # this caller's token still applies, and never indefinitely
+            deadline = time.monotonic() + (token.timeout(60) if token is not None else 60)
+            while not wait_futures([future], timeout=0.1).done:
+                if token is not None:
+                    token.check()
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out waiting for another download of {url}")
+            return future.result()
+        
+        try:
+            data = self.download(url, token)
+            self.put(url, data)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(url, None)
+    
+    def prefetch(self, urls, callback=None, token=None):
+        """Fetch URLs in the background, calling callback(url, error) for each
+        
+        Fetches still queued when the token is cancelled fail without
+        touching the network.
+        """
+        def task(url):
+            try:
+                if token is not None:
+                    token.check()
+                self.fetch(url, token)
+                error = None
+            except Exception as e:
+                error = e
+            if callback:
+                callback(url, error)
+        
+        for url in urls:
+            self.executor.submit(task, url)
+
+
+class ImagePrefetcher(QObject):
+    """Bridges ImageCache background fetches to Qt signals"""
+    loaded = pyqtSignal(str)
+    failed = pyqtSignal(str, str)
+    
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+    
+    def prefetch(self, urls, token=None):
+        self.cache.prefetch(urls, self.on_fetched, token)
+    
+    def on_fetched(self, url, error):
+        # Called from a pool thread; the signals are queued to the UI thread
+        if error is None:
+            self.loaded.emit(url)
+        else:
+            self.failed.emit(url, str(error))
+
+
+def image_dhash(image):
+    """64-bit difference hash of a decoded QImage
+    
+    The image is reduced to 9x8 grey pixels and each bit records whether a
+    pixel is brighter than its left neighbour, so re-encoding, resizing and
+    small edits change only a few bits.
+    """
+    import numpy as np
+    small = image.scaled(
+        9, 8, Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation
+    ).convertToFormat(QImage.Format.Format_Grayscale8)
+    pixels = np.frombuffer(small.constBits().asstring(small.sizeInBytes()), dtype=np.uint8)
+    pixels = pixels.reshape(8, small.bytesPerLine())[:, :9]
+    bits = np.packbits(pixels[:, 1:] > pixels[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def dhash_bytes(data):
+    """Decode image bytes and return their dHash
+    
+    The decoder is asked for the hash size directly, which lets the JPEG
+    decoder skip most of the work of a full-size decode.
+    """
+    buffer = QBuffer()
+    buffer.setData(QByteArray(data))
+    buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+    reader = QImageReader(buffer)
+    reader.setScaledSize(QSize(9, 8))
+    image = reader.read()
+    if image.isNull():
+        raise ValueError(f"unsupported or corrupt image data: {reader.errorString()}")
+    return image_dhash(image)
+
+
+def hamming_distances(hashes, value):
+    """Bit differences between every uint64 in hashes and value"""
+    import numpy as np
+    diff = hashes ^ np.uint64(value)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(diff)
+    # NumPy < 2.0 has no popcount ufunc; count per byte with a lookup table
+    table = np.array([bin(n).count("1") for n in range(256)], dtype=np.uint8)
+    return table[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class HashIndex:
+    """Persistent index of the dHashes of saved images
+    
+    Hashes are stored in SQLite and searched in memory as one NumPy uint64
+    array, so finding the nearest of 100k images is a single vectorized
+    XOR and popcount. The array is loaded on first use. A match whose
+    file is no longer in output_dir is dropped when it is found.
+    """
+    
+    def __init__(self, path=CACHE_DIR / "image_hashes.db", output_dir=OUTPUT_DIR):
+        self.path = Path(path)
+        self.output_dir = Path(output_dir)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS hashes (filename TEXT PRIMARY KEY, hash INTEGER NOT NULL)"
+            )
+        self.names = None
+        self.positions = None
+        self.hashes = None
+        self.size = 0
+        # Claimed filenames whose files may not be written yet
+        self.claimed = set()
+    
+    @staticmethod
+    def to_sql(value):
+        # SQLite integers are signed 64-bit
+        return value - (1 << 64) if value >= 1 << 63 else value
+    
+    def load(self):
+        """Read the index into memory; the caller holds the lock"""
+        if self.names is not None:
+            return
+        import numpy as np
+        rows = self.conn.execute("SELECT filename, hash FROM hashes").fetchall()
+        self.names = [row[0] for row in rows]
+        self.positions = {name: position for position, name in enumerate(self.names)}
+        self.size = len(rows)
+        self.hashes = np.zeros(max(1024, 2 * self.size), dtype=np.uint64)
+        self.hashes[:self.size] = np.array([row[1] for row in rows], dtype=np.int64).view(np.uint64)
+    
+    def nearest_locked(self, value):
+        self.load()
+        while self.size:
+            distances = hamming_distances(self.hashes[:self.size], value)
+            position = int(distances.argmin())
+            filename = self.names[position]
+            if (self.output_dir / filename).exists():
+                self.claimed.discard(filename)
+                return filename, int(distances[position])
+            if filename in self.claimed:
+                return filename, int(distances[position])
+            # Deleted outside the app; forget it and look again
+            self.remove_locked([filename])
+        return None, None
+    
+    def add_locked(self, entries):
+        import numpy as np
+        self.load()
+        for filename, value in entries:
+            position = self.positions.get(filename)
+            if position is None:
+                if self.size == len(self.hashes):
+                    self.hashes = np.concatenate([self.hashes, np.zeros_like(self.hashes)])
+                position = self.size
+                self.size += 1
+                self.names.append(filename)
+                self.positions[filename] = position
+            self.hashes[position] = value
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO hashes (filename, hash) VALUES (?, ?)",
+                [(filename, self.to_sql(value)) for filename, value in entries]
+            )
+    
+    def nearest(self, value):
+        """Return (filename, distance) of the closest stored hash, or (None, None)"""
+        with self.lock:
+            return self.nearest_locked(value)
+    
+    def add(self, entries):
+        """Store (filename, hash) pairs in one transaction"""
+        with self.lock:
+            self.add_locked(entries)
+    
+    def claim(self, value, allocate, skip_within=DEDUP_MAX_DISTANCE):
+        """Reserve a filename for an image unless a stored one is too similar
+        
+        Returns (filename, nearest, distance). filename is None when the
+        nearest stored image is within skip_within bits; otherwise it comes
+        from allocate() and is indexed at once, so a near-duplicate claimed
+        right after is caught even before the first file is written.
+        """
+        with self.lock:
+            nearest, distance = self.nearest_locked(value)
+            if nearest is not None and distance <= skip_within:
+                return None, nearest, distance
+            filename = allocate()
+            self.add_locked([(filename, value)])
+            self.claimed.add(filename)
+            return filename, nearest, distance
+    
+    def remove_locked(self, filenames):
+        self.load()
+        for filename in filenames:
+            self.claimed.discard(filename)
+            position = self.positions.pop(filename, None)
+            if position is None:
+                continue
+            # Move the last entry into the gap
+            last = self.size - 1
+            if position != last:
+                self.names[position] = self.names[last]
+                self.hashes[position] = self.hashes[last]
+                self.positions[self.names[position]] = position
+            self.names.pop()
+            self.size -= 1
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM hashes WHERE filename = ?", [(filename,) for filename in filenames]
+            )
+    
+    def remove(self, *filenames):
+        """Forget files, e.g. ones that failed to write or were deleted"""
+        with self.lock:
+            self.remove_locked(filenames)
+    
+    def filenames(self):
+        with self.lock:
+            self.load()
+            return set(self.names)
+
+
+def backfill_hash_index(output_dir=OUTPUT_DIR, workers=None):
+    """Index every JPG in output_dir that is missing from its HashIndex
+    
+    Entries of files deleted since are dropped. Returns (hashed, removed,
+    failed) counts.
+    """
+    output_dir = Path(output_dir)
+    index = HashIndex(output_dir / ".cache" / "image_hashes.db", output_dir)
+    on_disk = {
+        entry.name for entry in os.scandir(output_dir)
+        if entry.is_file() and entry.name.lower().endswith(".jpg")
+    }
+    indexed = index.filenames()
+    removed = indexed - on_disk
+    index.remove(*removed)
+    
+    def task(name):
+        try:
+            return name, dhash_bytes((output_dir / name).read_bytes()), None
+        except Exception as e:
+            return name, None, e
+    
+    hashed = []
+    failed = 0
+    missing = sorted(on_disk - indexed)
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for done, (name, value, error) in enumerate(pool.map(task, missing), 1):
+            if error is not None:
+                failed += 1
+                print(f"[ERROR] Could not hash {name}: {error}", file=sys.stderr)
+            else:
+                hashed.append((name, value))
+            if len(hashed) >= 1000 or done == len(missing):
+                index.add(hashed)
+                print(f"[INFO] Hashed {done}/{len(missing)} image(s)")
+                hashed = []
+    return len(missing) - failed, len(removed), failed
+
+
+def pillow_available():
+    """Whether Pillow, which post-processing needs, is installed"""
+    return importlib.util.find_spec("PIL") is not None
+
+
+def xmp_packet(phrase, style, prompt):
+    """XMP packet carrying phrase, style and prompt as Dublin Core fields"""
+    from xml.sax.saxutils import escape
+    return (
+        '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/">'
+        '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+        '<rdf:Description rdf:about="" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        f'<dc:title><rdf:Alt><rdf:li xml:lang="x-default">{escape(phrase)}</rdf:li></rdf:Alt></dc:title>'
+        f'<dc:subject><rdf:Bag><rdf:li>{escape(style)}</rdf:li></rdf:Bag></dc:subject>'
+        f'<dc:description><rdf:Alt><rdf:li xml:lang="x-default">{escape(prompt)}</rdf:li></rdf:Alt>'
+        '</dc:description></rdf:Description></rdf:RDF></x:xmpmeta><?xpacket end="w"?>'
+    ).encode("utf-8")
+
+
+def postprocess_image(path, phrase, style, prompt, quality=JPEG_QUALITY, variants=None):
+    """Re-encode a saved image as a JPEG with embedded metadata and write its size variants
+    
+    Runs in a PostProcessor worker process. The image is fully decoded
+    first, so a truncated or non-image download raises ValueError and is
+    left untouched. Variants go to a subdirectory per variant name next to
+    the image. Returns (wall start, seconds, bytes written).
+    """
+    from PIL import Image
+    from PIL.ExifTags import Base
+    wall_start = time.time()
+    started = time.perf_counter()
+    path = Path(path)
+    try:
+        with Image.open(path) as source:
+            source.load()
+            image = source.convert("RGB") if source.mode != "RGB" else source.copy()
+    except (OSError, SyntaxError) as e:
+        raise ValueError(f"{path.name} is not a readable image: {e}") from e
+    
+    exif = Image.Exif()
+    exif[Base.Software] = "Bing Image Creator GUI"
+    # ImageDescription is ASCII only, so it is left out rather than
+    # mangled for other prompts; the XP tags and XMP keep the Unicode text
+    if prompt.isascii():
+        exif[Base.ImageDescription] = prompt
+    exif[Base.XPTitle] = phrase.encode("utf-16-le") + b"\0\0"
+    exif[Base.XPComment] = prompt.encode("utf-16-le") + b"\0\0"
+    exif[Base.XPKeywords] = style.encode("utf-16-le") + b"\0\0"
+    xmp = xmp_packet(phrase, style, prompt)
+    
+    def encode(picture, dpi):
+        buffer = io.BytesIO()
+        picture.save(buffer, "JPEG", quality=quality, optimize=True, dpi=(dpi, dpi),
+                     exif=exif, xmp=xmp)
+        return buffer.getvalue()
+    
+    written = 0
+    for name, (longest_side, dpi) in (POSTPROCESS_VARIANTS if variants is None else variants).items():
+        scale = min(1.0, longest_side / max(image.size))
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        variant = image if size == image.size else image.resize(size, Image.Resampling.LANCZOS)
+        data = encode(variant, dpi)
+        (path.parent / name).mkdir(exist_ok=True)
+        atomic_write(path.parent / name / path.name, data)
+        written += len(data)
+    data = encode(image, 72)
+    atomic_write(path, data)
+    return wall_start, time.perf_counter() - started, written + len(data)
+
+
+class PostProcessor:
+    """Runs postprocess_image for saved images in a pool of worker processes
+    
+    Decoding, resampling and encoding are CPU bound, so they run in
+    separate processes and never compete with the UI or the pipeline
+    threads. submit() does not block; wait() blocks until everything
+    submitted so far is done. The pool uses spawned processes because
+    forking a process that runs Qt and worker threads is unsafe. With an
+    OutputCatalog, every image counts as one of its writes until it is
+    done, so the re-encode does not trigger a rescan of output_dir. A pool
+    broken by a dying worker process is replaced, and the images it took
+    down are retried once.
+    """
+    
+    def __init__(self, output_dir=OUTPUT_DIR, quality=JPEG_QUALITY, variants=None, workers=None,
+                 output_catalog=None):
+        self.output_dir = Path(output_dir)
+        self.output_catalog = output_catalog
+        self.quality = quality
+        self.variants = POSTPROCESS_VARIANTS if variants is None else variants
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.executor = None
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.processed = 0
+        self.failed = 0
+        self.bytes_written = 0
+        self.busy_seconds = 0.0
+        self.first_submitted = None
+        self.last_finished = None
+    
+    def submit(self, filename, phrase, style, prompt):
+        """Queue one saved image; returns a Future of postprocess_image's result"""
+        future = Future()
+        with self.lock:
+            if self.first_submitted is None:
+                self.first_submitted = time.perf_counter()
+            writing = ExitStack()
+            if self.output_catalog is not None:
+                writing.enter_context(self.output_catalog.writing())
+            self.pending.add(future)
+        future.add_done_callback(lambda _: writing.close())
+        future.add_done_callback(self.on_done)
+        args = (str(self.output_dir / filename), phrase, style, prompt, self.quality, self.variants)
+        self.run(future, args)
+        return future
+    
+    def run(self, future, args, retried=False):
+        """Hand one image to the pool, starting the pool if needed"""
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            executor = self.executor
+        try:
+            attempt = executor.submit(postprocess_image, *args)
+        except Exception as e:
+            # A pool that broke earlier refuses new work right away
+            attempt = Future()
+            attempt.set_exception(e)
+        attempt.add_done_callback(partial(self.on_attempt, future, args, executor, retried))
+    
+    def on_attempt(self, future, args, executor, retried, attempt):
+        error = None if attempt.cancelled() else attempt.exception()
+        if isinstance(error, BrokenProcessPool) and not retried:
+            with self.lock:
+                if self.executor is executor:
+                    self.executor = None
+            executor.shutdown(wait=False)
+            self.run(future, args, retried=True)
+        elif attempt.cancelled():
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(attempt.result())
+    
+    def on_done(self, future):
+        with self.lock:
+            self.pending.discard(future)
+            self.last_finished = time.perf_counter()
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+                return
+            wall_start, seconds, written = future.result()
+            self.processed += 1
+            self.busy_seconds += seconds
+            self.bytes_written += written
+        METRICS.record("postprocess", wall_start, seconds)
+    
+    def wait(self):
+        """Block until every submitted image is processed"""
+        with self.lock:
+            pending = list(self.pending)
+        wait_futures(pending)
+    
+    def shutdown(self):
+        """Finish queued images and stop the worker processes"""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+    
+    def stats_text(self):
+        with self.lock:
+            elapsed = (self.last_finished - self.first_submitted) if self.last_finished else 0.0
+            rate = self.processed / elapsed if elapsed > 0 else 0.0
+            mean = self.busy_seconds / self.processed if self.processed else 0.0
+            # Images per second the pool could sustain if it were never idle
+            capacity = self.workers / mean if mean > 0 else 0.0
+            return (f"Post-process: {self.processed} image(s), {rate:.1f} images/s, "
+                    f"{mean * 1000:.0f} ms/image, capacity {capacity:.1f} images/s "
+                    f"with {self.workers} process(es), {self.failed} failed")
+
+
+class PostProcessNotifier(QObject):
+    """Bridges PostProcessor results to Qt signals
+    
+    finished carries (processed, failed, seconds) once every image of a
+    post() call is done.
+    """
+    processed = pyqtSignal(str)
+    failed = pyqtSignal(str, str)
+    finished = pyqtSignal(int, int, float)
+    
+    def __init__(self, postprocessor):
+        super().__init__()
+        self.postprocessor = postprocessor
+    
+    def post(self, items):
+        """Post-process (filename, phrase, style, prompt) items"""
+        started = time.perf_counter()
+        counts = {"remaining": len(items), "failed": 0}
+        lock = threading.Lock()
+        
+        def on_done(filename, future):
+            # Called from the pool's result thread; the signals are queued
+            # to the UI thread
+            error = "cancelled" if future.cancelled() else future.exception()
+            if error is None:
+                self.processed.emit(filename)
+            else:
+                self.failed.emit(filename, str(error))
+            with lock:
+                counts["remaining"] -= 1
+                counts["failed"] += error is not None
+                done = counts["remaining"] == 0
+            if done:
+                self.finished.emit(len(items) - counts["failed"], counts["failed"],
+                                   time.perf_counter() - started)
+        
+        for item in items:
+            try:
+                future = self.postprocessor.submit(*item)
+            except Exception as e:
+                future = Future()
+                future.set_exception(e)
+            future.add_done_callback(partial(on_done, item[0]))
+
+
+class OllamaEmbedder:
+    """Embeds texts with an Ollama embedding model"""
+    # Cosine similarity from which a saved image counts as a match
+    match_threshold = 0.8
+    
+    def __init__(self, model=EMBEDDING_MODEL):
+        self.model = model
+        self.name = "ollama-" + re.sub(r"[^\w.-]", "-", model)
+    
+    def embed(self, texts):
+        import numpy as np
+        return np.asarray(ollama_embed(self.model, texts), dtype=np.float32)
+
+
+class HashingEmbedder:
+    """Local fallback embedder that needs no model
+    
+    Words and character trigrams are hashed into a fixed number of signed
+    buckets. It matches shared words and spellings, not synonyms, so the
+    threshold is high enough that one shared word such as an article does
+    not make two phrases a match.
+    """
+    match_threshold = 0.85
+    
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+    
+    def embed(self, texts):
+        import numpy as np
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = re.findall(r"\w+", unicodedata.normalize("NFC", text).casefold())
+            padded = f" {' '.join(words)} "
+            for feature in words + [padded[i:i + 3] for i in range(len(padded) - 2)]:
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vectors[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+        return vectors
+
+
+class EmbeddingIndex:
+    """Embeddings of logged phrases and prompts, for finding similar saved images
+    
+    Each generation log entry contributes a phrase row and a prompt row.
+    Vectors are unit-length float32 rows appended to a flat file and read
+    through np.memmap, so the matrix is never loaded whole and syncing new
+    log entries only writes their rows. Row metadata and the last indexed
+    log id live in SQLite. Each embedder has its own files, since vectors
+    of different models cannot be compared.
+    """
+    
+    def __init__(self, embedder, output_dir=OUTPUT_DIR, directory=None):
+        self.embedder = embedder
+        self.output_dir = Path(output_dir)
+        directory = Path(directory) if directory else self.output_dir / ".cache" / "embeddings"
+        directory.mkdir(parents=True, exist_ok=True)
+        self.vector_path = directory / f"{embedder.name}.f32"
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(directory / f"{embedder.name}.db"), check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                " position INTEGER PRIMARY KEY, log_id INTEGER NOT NULL, kind TEXT NOT NULL,"
+                " phrase TEXT NOT NULL, style TEXT NOT NULL, prompt TEXT NOT NULL,"
+                " filename TEXT NOT NULL)"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+        self.last_log_id = int(meta.get("last_log_id", 0))
+        self.styles = [row[0].casefold() for row in
+                       self.conn.execute("SELECT style FROM rows ORDER BY position")]
+        self.style_array = None
+        self.matrix = None
+        self.repair()
+    
+    def repair(self):
+        """Make the vector file and the row table agree after a crash
+        
+        Vectors are written before their rows are committed, so extra bytes
+        are rows that never made it; fewer bytes drop the affected entries,
+        which the next sync embeds again.
+        """
+        size = self.vector_path.stat().st_size if self.vector_path.exists() else 0
+        row_bytes = (self.dim or 0) * 4
+        complete = size // row_bytes if row_bytes else 0
+        if complete < len(self.styles):
+            first_lost = self.conn.execute(
+                "SELECT log_id FROM rows WHERE position = ?", (complete,)
+            ).fetchone()[0]
+            with self.conn:
+                self.conn.execute("DELETE FROM rows WHERE log_id >= ?", (first_lost,))
+                self.last_log_id = self.conn.execute(
+                    "SELECT COALESCE(MAX(log_id), 0) FROM rows"
+                ).fetchone()[0]
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_log_id', ?)",
+                    (str(self.last_log_id),)
+                )
+            del self.styles[self.conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]:]
+        if size != len(self.styles) * row_bytes:
+            with open(self.vector_path, "ab") as f:
+                f.truncate(len(self.styles) * row_bytes)
+    
+    def __len__(self):
+        return len(self.styles)
+    
+    @staticmethod
+    def normalize(vectors):
+        import numpy as np
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+    
+    def append(self, vectors, rows, last_log_id):
+        """Append unit vectors and their (log_id, kind, phrase, style, prompt, filename) rows"""
+        with self.lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (str(self.dim),)
+                    )
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"{self.embedder.name} returned {vectors.shape[1]} dimensions, "
+                                 f"the index has {self.dim}")
+            with open(self.vector_path, "ab") as f:
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            start = len(self.styles)
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO rows (position, log_id, kind, phrase, style, prompt, filename)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(start + offset,) + tuple(row) for offset, row in enumerate(rows)]
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_log_id', ?)",
+                    (str(last_log_id),)
+                )
+            self.styles.extend(row[3].casefold() for row in rows)
+            self.last_log_id = last_log_id
+            self.style_array = None
+    
+    def sync(self, generation_log, chunk_size=64):
+        """Embed log entries added since the last sync; returns how many"""
+        added = 0
+        while True:
+            entries = generation_log.entries_since(self.last_log_id, chunk_size)
+            if not entries:
+                return added
+            texts = []
+            rows = []
+            for log_id, entry in entries:
+                for kind, field in (("phrase", "word_phrase"), ("prompt", "ai_generated_prompt")):
+                    texts.append(entry[field])
+                    rows.append((log_id, kind, entry["word_phrase"], entry["style"],
+                                 entry["ai_generated_prompt"], entry["filename"]))
+            with METRICS.span("embed_sync", embedder=self.embedder.name):
+                vectors = self.normalize(self.embedder.embed(texts))
+            self.append(vectors, rows, entries[-1][0])
+            added += len(entries)
+    
+    def search(self, text, style=None, k=SIMILAR_IMAGES_K, threshold=None):
+        """Return up to k saved images most similar to text, best first
+        
+        Only images of the given style whose files still exist are returned,
+        each as a dict with filename, phrase, style, prompt and score.
+        """
+        import numpy as np
+        if threshold is None:
+            threshold = self.embedder.match_threshold
+        with METRICS.span("embed_search", embedder=self.embedder.name):
+            query = self.normalize(self.embedder.embed([text]))[0]
+            with self.lock:
+                count = len(self.styles)
+                if not count or query.shape[0] != self.dim:
+                    return []
+                if self.matrix is None or self.matrix.shape[0] != count:
+                    self.matrix = np.memmap(self.vector_path, dtype=np.float32, mode="r",
+                                            shape=(count, self.dim))
+                if self.style_array is None:
+                    self.style_array = np.array(self.styles)
+                matrix, styles = self.matrix, self.style_array
+            scores = matrix @ query
+            if style:
+                scores[styles != style.casefold()] = -1.0
+            # Phrase and prompt rows of one image, and deleted files, compete
+            # for the top places, so look further than k
+            candidates = min(count, k * 8)
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            top = top[np.argsort(-scores[top])]
+            
+            results = {}
+            for position in top:
+                score = float(scores[position])
+                if score < threshold or len(results) == k:
+                    break
+                with self.lock:
+                    phrase, row_style, prompt, filename = self.conn.execute(
+                        "SELECT phrase, style, prompt, filename FROM rows WHERE position = ?",
+                        (int(position),)
+                    ).fetchone()
+                if filename in results or not (self.output_dir / filename).exists():
+                    continue
+                results[filename] = {"filename": filename, "phrase": phrase, "style": row_style,
+                                     "prompt": prompt, "score": score}
+        return list(results.values())
+
+
+class ThumbnailCache:
+    """Gallery thumbnails of saved images packed into a single file
+    
+    JPEG thumbnails are appended to a pack file and an SQLite table maps
+    each image filename to its (offset, length) in the pack, together with
+    the image's mtime and size when the thumbnail was made. A thumbnail is
+    only served while both still match, so edited or replaced images get a
+    new one. Replaced thumbnails leave dead bytes behind; once they
+    outweigh the live ones the pack is rewritten to a new file, which the
+    table switches to in the same transaction as the new offsets.
+    """
+    
+    def __init__(self, output_dir=OUTPUT_DIR, directory=None):
+        self.output_dir = Path(output_dir)
+        self.directory = Path(directory) if directory else self.output_dir / ".cache"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.directory / "thumbnails.db"), check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS thumbnails ("
+                " filename TEXT PRIMARY KEY, offset INTEGER NOT NULL, length INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL)"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'pack'").fetchone()
+        self.pack_path = self.directory / (row[0] if row else "thumbnails.pack")
+        # Packs left over from a compaction that was interrupted or finished
+        for path in self.directory.glob("thumbnails*.pack"):
+            if path != self.pack_path:
+                path.unlink(missing_ok=True)
+        self.pack = open(self.pack_path, "a+b")
+        self.compact()
+    
+    def compact(self, min_dead_bytes=16 * 1024 * 1024):
+        """Rewrite the pack without dead bytes if they outweigh the live ones"""
+        with self.lock:
+            pack_size = os.fstat(self.pack.fileno()).st_size
+            with self.conn:
+                # Entries past the end belong to writes lost in a crash
+                self.conn.execute("DELETE FROM thumbnails WHERE offset + length > ?", (pack_size,))
+            live = self.conn.execute("SELECT COALESCE(SUM(length), 0) FROM thumbnails").fetchone()[0]
+            dead = pack_size - live
+            if dead < min_dead_bytes or dead < live:
+                return
+            rows = self.conn.execute(
+                "SELECT filename, offset, length FROM thumbnails ORDER BY offset"
+            ).fetchall()
+            new_path = self.directory / f"thumbnails-{time.time_ns()}.pack"
+            moved = []
+            with open(new_path, "wb") as out:
+                for filename, offset, length in rows:
+                    self.pack.seek(offset)
+                    moved.append((out.tell(), filename))
+                    out.write(self.pack.read(length))
+                out.flush()
+                os.fsync(out.fileno())
+            with self.conn:
+                self.conn.executemany("UPDATE thumbnails SET offset = ? WHERE filename = ?", moved)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('pack', ?)", (new_path.name,)
+                )
+            self.pack.close()
+            self.pack_path.unlink(missing_ok=True)
+            self.pack_path = new_path
+            self.pack = open(self.pack_path, "a+b")
+    
+    def get(self, filename):
+        """Return the thumbnail bytes for an Output filename, or None if stale or missing"""
+        try:
+            stat = (self.output_dir / filename).stat()
+        except OSError:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT offset, length, mtime_ns, size FROM thumbnails WHERE filename = ?", (filename,)
+            ).fetchone()
+            if row is None or (row[2], row[3]) != (stat.st_mtime_ns, stat.st_size):
+                return None
+            self.pack.seek(row[0])
+            return self.pack.read(row[1])
+    
+    def put(self, filename, stat, data):
+        """Append a thumbnail made from the image as it was at stat"""
+        with self.lock:
+            self.pack.seek(0, os.SEEK_END)
+            offset = self.pack.tell()
+            self.pack.write(data)
+            self.pack.flush()
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO thumbnails (filename, offset, length, mtime_ns, size)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (filename, offset, len(data), stat.st_mtime_ns, stat.st_size)
+                )
+
+
+class ThumbnailSignals(QObject):
+    """Signals emitted by ThumbnailTask"""
+    loaded = pyqtSignal(str, QImage)
+
+
+class ThumbnailTask(QRunnable):
+    """Load a gallery thumbnail from the pack, or make and store it"""
+    
+    def __init__(self, signals, cache, filename, size=THUMBNAIL_SIZE):
+        super().__init__()
+        self.signals = signals
+        self.cache = cache
+        self.filename = filename
+        self.size = size
+    
+    def run(self):
+        image = QImage()
+        try:
+            data = self.cache.get(self.filename)
+            if data is not None:
+                image.loadFromData(data)
+            else:
+                with METRICS.span("thumbnail"):
+                    path = self.cache.output_dir / self.filename
+                    stat = path.stat()
+                    reader = QImageReader(str(path))
+                    # Lets the JPEG decoder produce the small size directly
+                    reader.setScaledSize(reader.size().scaled(
+                        self.size, self.size, Qt.AspectRatioMode.KeepAspectRatio
+                    ))
+                    image = reader.read()
+                    if not image.isNull():
+                        buffer = QBuffer()
+                        buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+                        image.save(buffer, "JPG", 85)
+                        self.cache.put(self.filename, stat, bytes(buffer.data()))
+        except Exception:
+            image = QImage()
+        # A null image marks a file that is gone or unreadable
+        self.signals.loaded.emit(self.filename, image)
+
+
+class ImageRenderSignals(QObject):
+    """Signals emitted by ImageRenderTask"""
+    rendered = pyqtSignal(str, int, int, QImage)
+    failed = pyqtSignal(str, str)
+    duplicate = pyqtSignal(str, str, int)
+
+
+class ImageRenderTask(QRunnable):
+    """Decode image bytes and scale them to a target size off the UI thread
+    
+    QImage is safe to use outside the GUI thread, unlike QPixmap. Decoded
+    originals are shared through decoded_cache so a resize only rescales.
+    Freshly decoded images are also looked up in hash_index, if given, and
+    reported through the duplicate signal when a saved image is similar.
+    """
+    
+    def __init__(self, signals, content_hash, data, width, height, decoded_cache,
+                 hash_index=None):
+        super().__init__()
+        self.signals = signals
+        self.content_hash = content_hash
+        self.data = data
+        self.width = width
+        self.height = height
+        self.decoded_cache = decoded_cache
+        self.hash_index = hash_index
+    
+    def run(self):
+        try:
+            decoded = False
+            with METRICS.span("decode_scale"):
+                image = self.decoded_cache.get(self.content_hash)
+                if image is None:
+                    image = QImage()
+                    if not image.loadFromData(self.data):
+                        raise ValueError("unsupported or corrupt image data")
+                    self.decoded_cache.put(self.content_hash, image)
+                    decoded = True
+                scaled = image.scaled(
+                    self.width, self.height,
+                    Qt.AspectRatioMode.KeepAspectRatio,
+                    Qt.TransformationMode.SmoothTransformation
+                )
+            self.signals.rendered.emit(self.content_hash, self.width, self.height, scaled)
+        except Exception as e:
+            self.signals.failed.emit(self.content_hash, str(e))
+            return
+        
+        if decoded and self.hash_index is not None:
+            try:
+                with METRICS.span("dedup_lookup"):
+                    nearest, distance = self.hash_index.nearest(image_dhash(image))
+            except Exception:
+                return
+            if nearest is not None and distance <= DEDUP_MAX_DISTANCE:
+                self.signals.duplicate.emit(self.content_hash, nearest, distance)
+
+
+class QImageCache:
+    """Thread-safe LRU of QImages bounded by total pixel bytes"""
+    
+    def __init__(self, byte_budget):
+        self.byte_budget = byte_budget
+        self.images = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+            return image
+    
+    def put(self, key, image):
+        with self.lock:
+            if key in self.images:
+                self.total_bytes -= self.images.pop(key).sizeInBytes()
+            self.images[key] = image
+            self.total_bytes += image.sizeInBytes()
+            while self.total_bytes > self.byte_budget and len(self.images) > 1:
+                _, evicted = self.images.popitem(last=False)
+                self.total_bytes -= evicted.sizeInBytes()
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+MAX_CONCURRENT_JOBS = 8
+
+
+class TokenBucket:
+    """Token bucket limiting the rate of Bing generation requests
+    
+    rate is in tokens per second. It can be lowered when Bing throttles us
+    and recovers additively towards max_rate after successes (AIMD).
+    """
+    
+    def __init__(self, rate, capacity):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def try_acquire(self):
+        """Take a token, or return the seconds to wait until one is available"""
+        with self.lock:
+            self.refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+    
+    def slow_down(self, factor=0.5, floor=1 / 600):
+        with self.lock:
+            self.refill()
+            self.rate = max(floor, self.rate * factor)
+    
+    def speed_up(self, step_fraction=0.1):
+        with self.lock:
+            self.refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate * step_fraction)
+
+
+class BingAccount:
+    """One Bing account in a CookiePool"""
+    
+    def __init__(self, name, generator, daily_quota=None):
+        self.name = name
+        self.generator = generator
+        self.daily_quota = daily_quota
+        self.remaining = daily_quota
+        self.healthy = True
+        self.in_flight = 0
+        self.completed = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.last_error = ""
+
+
+class CookiePool:
+    """Pool of Bing accounts, one ImageGenerator per U/SRCHHPGUSR pair
+    
+    Jobs go to the healthy account with the fewest requests in flight,
+    preferring the most remaining quota. Accounts cool down after being
+    throttled, drop out of rotation when their boosts run out (the last
+    account in rotation only cools down), and are removed when Bing
+    rejects their cookies with an explicit 401/403. generator_factory(u,
+    srchhpgusr) builds the generators and can be replaced by a fake for
+    testing.
+    """
+    AUTH_FAILURE_RE = re.compile(r"\b(401|403)\b|unauthori[sz]ed|forbidden", re.IGNORECASE)
+    EXHAUSTED_MARKERS = ("boost", "exhausted", "quota")
+    # Cooldown of an exhausted last account when the caller gives none
+    EXHAUSTED_COOLDOWN = 60.0
+    
+    def __init__(self, accounts=(), generator_factory=None):
+        self.accounts = list(accounts)
+        self.lock = threading.Lock()
+        self.generator_factory = generator_factory
+        # Most recent error of any account, for reporting an empty pool
+        self.last_error = ""
+    
+    @classmethod
+    def single(cls, generator, name="default"):
+        """Wrap one already created generator in a pool"""
+        return cls([BingAccount(name, generator)])
+    
+    @classmethod
+    def from_file(cls, path, generator_factory=None):
+        """Load accounts from a JSON list of {name, u, srchhpgusr, daily_quota}"""
+        if generator_factory is None:
+            def generator_factory(u_cookie, srchhpgusr):
+                return load_image_generator()(auth_cookie_u=u_cookie, auth_cookie_srchhpgusr=srchhpgusr)
+        
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        accounts = []
+        for index, entry in enumerate(config.get("accounts", []) if isinstance(config, dict) else config):
+            generator = generator_factory(entry["u"], entry["srchhpgusr"])
+            accounts.append(BingAccount(
+                entry.get("name") or f"account-{index + 1}",
+                generator,
+                entry.get("daily_quota")
+            ))
+        if not accounts:
+            raise ValueError(f"No accounts configured in {path}")
+        return cls(accounts, generator_factory)
+    
+    def available(self):
+        now = time.monotonic()
+        return [
+            account for account in self.accounts
+            if account.healthy and account.remaining != 0 and account.cooldown_until <= now
+        ]
+    
+    def acquire(self):
+        """Reserve the least-loaded healthy account, or return None"""
+        with self.lock:
+            candidates = self.available()
+            if not candidates:
+                return None
+            account = min(
+                candidates,
+                key=lambda a: (a.in_flight, -(a.remaining if a.remaining is not None else float("inf")))
+            )
+            account.in_flight += 1
+            return account
+    
+    def next_available_in(self):
+        """Seconds until a cooling-down account is usable, or None if none will be"""
+        with self.lock:
+            waiting = [
+                account.cooldown_until for account in self.accounts
+                if account.healthy and account.remaining != 0
+            ]
+        if not waiting:
+            return None
+        return max(0.0, min(waiting) - time.monotonic())
+    
+    def release(self, account, error=None, cooldown=0.0):
+        """Return an account after a request and update its health
+        
+        Returns a message when the account left the rotation, else None.
+        """
+        with self.lock:
+            account.in_flight -= 1
+            if error is None:
+                account.completed += 1
+                account.consecutive_failures = 0
+                if account.remaining is not None:
+                    account.remaining -= 1
+                return None
+            
+            message = str(error).lower()
+            account.last_error = self.last_error = str(error)
+            account.consecutive_failures += 1
+            if self.AUTH_FAILURE_RE.search(message):
+                account.healthy = False
+                return f"Account '{account.name}' removed: cookies appear to be stale ({error})"
+            if any(marker in message for marker in self.EXHAUSTED_MARKERS):
+                others = [a for a in self.accounts
+                          if a is not account and a.healthy and a.remaining != 0]
+                if others:
+                    account.remaining = 0
+                    return f"Account '{account.name}' has no boosts left"
+                # Dropping the last account would fail every later job;
+                # wait and try it again instead
+                cooldown = cooldown or self.EXHAUSTED_COOLDOWN
+                account.cooldown_until = time.monotonic() + cooldown
+                return f"Account '{account.name}' has no boosts left; retrying in {cooldown:.0f}s"
+            if cooldown:
+                account.cooldown_until = time.monotonic() + cooldown
+            return None
+    
+    def healthy_count(self):
+        with self.lock:
+            return sum(1 for account in self.accounts if account.healthy)
+    
+    def stats_text(self):
+        with self.lock:
+            parts = []
+            for account in self.accounts:
+                state = "ok" if account.healthy else "stale"
+                if account.healthy and account.remaining == 0:
+                    state = "exhausted"
+                quota = "" if account.remaining is None else f", {account.remaining} left"
+                parts.append(f"{account.name}: {state}, {account.completed} done{quota}")
+        return "; ".join(parts)
 
-# Style categories from the provided list
-STYLE_CATEGORIES = {
-    "Photographic & Realistic": [
-        "Photorealistic",
-        "Cinematic Film Still",
-        "Analog Film (35mm / Kodak / Fujifilm)",
-        "Film Noir",
-        "Portrait Photography",
-        "Food Photography",
-        "Macro Photography",
-        "Street Photography",
-        "Old Photograph BW",
-        "Old Photograph Colorized"
-    ],
-    "Artistic & Painting": [
-        "Oil Painting",
-        "Watercolor",
-        "BW Pencil Sketch",
-        "Color Pencil Sketch",
-        "BW Charcoal Drawing",
-        "Color Charcoal Drawing",
-        "Digital Painting",
-        "Surrealism",
-        "Impressionism"
-    ],
-    "Graphic & Stylized": [
-        "Illustration",
-        "Anime",
-        "Comic Book",
-        "Graphic Novel",
-        "Pixel Art",
-        "Vector Graphics",
-        "Flat Design"
-    ],
-    "3D & Rendering": [
-        "3D Rendering",
-        "Octane Render / Unreal Engine",
-        "Lowpoly",
-        "Isometric",
-        "Blender Render"
-    ],
-    "Genre & Aesthetic": [
-        "Cyberpunk",
-        "Neonpunk",
-        "Steampunk",
-        "Fantasy",
-        "Sci-Fi",
-        "Art Deco",
-        "Art Nouveau",
-        "Minimalist",
-        "Vintage / Retro",
-        "Concept Art"
-    ]
-}
+
+class JobCancelled(Exception):
+    """Raised when a job was cancelled or ran past its deadline"""
+
+
+class CancelToken:
+    """Cancellation flag and optional deadline shared by every stage of a job
+    
+    Stages check the token between steps and cap network timeouts at the
+    time left, so a cancelled or overdue job stops at the next boundary
+    instead of running to completion.
+    """
+    
+    def __init__(self, timeout=None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.event = threading.Event()
+        self.reason = None
+    
+    def cancel(self, reason="cancelled"):
+        if not self.event.is_set():
+            self.reason = reason
+            self.event.set()
+    
+    def is_cancelled(self):
+        if not self.event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline exceeded")
+        return self.event.is_set()
+    
+    def remaining(self):
+        """Seconds left before the deadline, or None without one"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+    
+    def check(self):
+        if self.is_cancelled():
+            raise JobCancelled(self.reason)
+    
+    def timeout(self, default):
+        """Cap a network timeout at the time left, raising if none is"""
+        self.check()
+        remaining = self.remaining()
+        return default if remaining is None else max(0.1, min(default, remaining))
+
+
+def wait_for_result(future, token=None, poll=0.1):
+    """Wait for a future, giving up early when the token is cancelled
+    
+    The future is cancelled so the scheduler drops the job if it has not
+    started; a Bing call already in flight is left to finish and ignored.
+    """
+    while token is not None:
+        if wait_futures([future], timeout=poll).done:
+            break
+        if token.is_cancelled():
+            future.cancel()
+            raise JobCancelled(token.reason)
+    return future.result()
+
+
+class ScheduledJob:
+    """A generation request waiting in the scheduler"""
+    
+    def __init__(self, prompt, num_images, priority, on_status=None, token=None):
+        self.prompt = prompt
+        self.num_images = num_images
+        self.priority = priority
+        self.on_status = on_status
+        self.token = token
+        self.attempts = 0
+        self.future = Future()
+    
+    def abandoned(self):
+        """True if nobody is waiting for this job any more"""
+        return self.future.cancelled() or (self.token is not None and self.token.is_cancelled())
+    
+    def settle(self, result=None, error=None):
+        """Resolve the future unless the caller already cancelled it"""
+        if self.token is not None and self.token.is_cancelled():
+            error = JobCancelled(self.token.reason)
+        try:
+            if error is not None:
+                self.future.set_exception(error)
+            else:
+                self.future.set_result(result)
+        except InvalidStateError:
+            pass
+
+
+class GenerationScheduler:
+    """Rate-limit-aware scheduler in front of ImageGenerator
+    
+    Jobs wait in a priority queue (interactive before batch, FIFO within a
+    priority) and each Bing call takes a token from a TokenBucket. When
+    Bing throttles us or boosts run out, every worker pauses for an
+    exponential backoff with jitter and the bucket rate is halved; it
+    recovers gradually on success. Failed jobs are requeued until
+    max_attempts, except for errors that retrying cannot fix. Requests are
+    spread over the accounts of a CookiePool; with several accounts a
+    throttled one only cools down itself.
+    """
+    THROTTLE_MARKERS = ("429", "too many", "throttl", "rate limit", "boost", "exhausted",
+                        "redirect", "try again later")
+    PERMANENT_MARKERS = ("being reviewed", "has been blocked", "not supported",
+                         "no new images", "check your prompt")
+    
+    def __init__(self, pool=None, rate_per_minute=6, burst=2, workers=1, max_attempts=4,
+                 base_backoff=15, max_backoff=600):
+        self.pool = pool
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.ready = []
+        self.delayed = []
+        self.sequence = itertools.count()
+        self.paused_until = 0.0
+        self.throttle_streak = 0
+        self.completed = 0
+        self.retried = 0
+        self.throttled = 0
+        self.condition = threading.Condition()
+        self.workers = [
+            threading.Thread(target=self.worker, name=f"bing-scheduler-{n}", daemon=True)
+            for n in range(max(1, workers))
+        ]
+        for worker in self.workers:
+            worker.start()
+    
+    def submit(self, prompt, num_images, priority=PRIORITY_INTERACTIVE, on_status=None, token=None):
+        """Queue a generation request and return a Future of its image URLs
+        
+        Jobs whose future is cancelled or whose token is cancelled or past
+        its deadline are dropped instead of being sent to Bing or retried.
+        """
+        job = ScheduledJob(prompt, num_images, priority, on_status, token)
+        with self.condition:
+            heapq.heappush(self.ready, (priority, next(self.sequence), job))
+            self.condition.notify()
+        return job.future
+    
+    def pending(self):
+        with self.condition:
+            return len(self.ready) + len(self.delayed)
+    
+    def next_job(self):
+        """Block until a job is due and the rate limit allows a request"""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                while self.delayed and self.delayed[0][0] <= now:
+                    _, seq, job = heapq.heappop(self.delayed)
+                    heapq.heappush(self.ready, (job.priority, seq, job))
+                # Abandoned jobs must not use up a rate limit token
+                while self.ready and self.ready[0][2].abandoned():
+                    heapq.heappop(self.ready)[2].settle(error=JobCancelled("cancelled"))
+                
+                waits = []
+                if self.delayed:
+                    waits.append(self.delayed[0][0] - now)
+                if self.ready:
+                    if now < self.paused_until:
+                        waits.append(self.paused_until - now)
+                    else:
+                        wait = self.bucket.try_acquire()
+                        if wait == 0:
+                            return heapq.heappop(self.ready)[2]
+                        waits.append(wait)
+                self.condition.wait(timeout=min(waits) if waits else None)
+    
+    def classify(self, error):
+        message = str(error).lower()
+        if any(marker in message for marker in self.PERMANENT_MARKERS):
+            return "permanent"
+        if any(marker in message for marker in self.THROTTLE_MARKERS):
+            return "throttled"
+        return "transient"
+    
+    def backoff_delay(self, attempts):
+        delay = min(self.max_backoff, self.base_backoff * (2 ** (attempts - 1)))
+        # Equal jitter between half and the whole delay spreads out retries
+        return random.uniform(delay / 2, delay)
+    
+    def requeue(self, job, delay):
+        remaining = job.token.remaining() if job.token is not None else None
+        if remaining is not None and remaining < delay:
+            # The retry would start after the deadline; fail now
+            job.token.cancel("deadline exceeded")
+            job.settle(error=JobCancelled(job.token.reason))
+            return
+        with self.condition:
+            heapq.heappush(self.delayed, (time.monotonic() + delay, next(self.sequence), job))
+            self.condition.notify_all()
+    
+    def worker(self):
+        while True:
+            job = self.next_job()
+            if job.abandoned():
+                job.settle(error=JobCancelled("cancelled"))
+                continue
+            
+            # The GUI may attach or replace the pool after the scheduler starts
+            pool = self.pool
+            if pool is None:
+                job.settle(error=RuntimeError("No Bing account configured"))
+                continue
+            account = pool.acquire()
+            if account is None:
+                wait = pool.next_available_in()
+                if wait is None:
+                    reason = f" (last error: {pool.last_error})" if pool.last_error else ""
+                    job.settle(error=RuntimeError(f"No healthy Bing accounts available{reason}"))
+                else:
+                    self.requeue(job, wait)
+                continue
+            
+            job.attempts += 1
+            try:
+                with METRICS.span("bing_generate", account=account.name):
+                    images = account.generator.generate(prompt=job.prompt, num_images=job.num_images)
+            except Exception as e:
+                self.on_failure(job, account, e)
+                continue
+            
+            pool.release(account)
+            with self.condition:
+                self.completed += 1
+                self.throttle_streak = 0
+            self.bucket.speed_up()
+            job.settle(extract_image_urls(images))
+    
+    def on_failure(self, job, account, error):
+        kind = self.classify(error)
+        delay = self.backoff_delay(job.attempts)
+        removed = self.pool.release(account, error, cooldown=delay if kind == "throttled" else 0.0)
+        if removed and job.on_status:
+            job.on_status(removed)
+        
+        if kind == "permanent" or job.attempts >= self.max_attempts or job.abandoned():
+            job.settle(error=error)
+            return
+        
+        with self.condition:
+            if kind == "throttled":
+                self.throttled += 1
+                self.throttle_streak += 1
+                self.bucket.slow_down()
+                if not self.pool.available():
+                    # No other account can take the work; back off globally
+                    delay = self.backoff_delay(self.throttle_streak)
+                    self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                else:
+                    delay = 0.0
+            self.retried += 1
+        self.requeue(job, delay)
+        if job.on_status:
+            job.on_status(f"Generation attempt {job.attempts} failed ({error}); "
+                          f"retrying in {delay:.0f}s")
+    
+    def stats_text(self):
+        rate = self.bucket.rate * 60
+        text = (f"Scheduler: {self.completed} done, {self.retried} retried, "
+                f"{self.throttled} throttled, {rate:.1f}/min")
+        if self.pool is not None and len(self.pool.accounts) > 1:
+            text += f" | {self.pool.stats_text()}"
+        return text
+
+
+class OllamaModelsThread(QThread):
+    """Thread for discovering installed Ollama models without blocking the UI"""
+    finished = pyqtSignal(list)
+    error = pyqtSignal(str)
+    unavailable = pyqtSignal()
+    
+    def run(self):
+        try:
+            response = get_http_client().get(f"{OLLAMA_URL}/api/tags", timeout=2)
+        except Exception:
+            self.unavailable.emit()
+            return
+        if response.status_code == 200:
+            models = response.json().get("models", [])
+            self.finished.emit([model["name"] for model in models])
+        else:
+            self.error.emit("Failed to fetch Ollama models")
+
+
+class EmbeddingSyncThread(QThread):
+    """Thread for bringing the similar-images index up to date with the generation log"""
+    finished = pyqtSignal(object, int)
+    error = pyqtSignal(str)
+    
+    def __init__(self, index, generation_log):
+        super().__init__()
+        self.index = index
+        self.generation_log = generation_log
+    
+    def run(self):
+        try:
+            self.finished.emit(self.index, self.index.sync(self.generation_log))
+        except Exception as e:
+            self.error.emit(str(e))
+
+
+class SimilarImagesThread(QThread):
+    """Thread for looking up saved images similar to a new request"""
+    finished = pyqtSignal(list)
+    error = pyqtSignal(str)
+    
+    def __init__(self, index, text, style, k=SIMILAR_IMAGES_K):
+        super().__init__()
+        self.index = index
+        self.text = text
+        self.style = style
+        self.k = k
+    
+    def run(self):
+        try:
+            self.finished.emit(self.index.search(self.text, self.style, self.k))
+        except Exception as e:
+            self.error.emit(str(e))
+
+
+class OllamaWarmupThread(QThread):
+    """Thread for loading an Ollama model before the first prompt needs it"""
+    finished = pyqtSignal(str, float)
+    error = pyqtSignal(str, str)
+    
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+    
+    def run(self):
+        try:
+            self.finished.emit(self.model, ollama_load_model(self.model))
+        except Exception as e:
+            self.error.emit(self.model, str(e))
+
+
+class GenerationJob:
+    """A phrase queued for prompt generation and image generation
+    
+    States: matching -> queued -> prompting -> ready -> generating ->
+    done/failed, or cancelled from any state before done. A job that runs
+    past its deadline fails. A job whose phrase matches saved images is
+    offered until the user either reuses them, going straight to done, or
+    queues it anyway.
+    """
+    _ids = itertools.count(1)
+    
+    def __init__(self, phrase, style, additional_info, model, num_images, timeout=None):
+        self.id = next(self._ids)
+        self.token = CancelToken(timeout)
+        self.phrase = phrase
+        self.style = style
+        self.additional_info = additional_info
+        self.model = model
+        self.num_images = num_images
+        self.prompt = None
+        self.state = "queued"
+        self.image_urls = []
+        self.error = ""
+        self.thread = None
+        self.list_item = None
+        self.matches = []
+        self.reused = False
+    
+    def label(self):
+        text = f"#{self.id} {self.phrase} [{self.style}] - {self.state}"
+        if self.state == "offered":
+            text += f" ({len(self.matches)} saved)"
+        elif self.state == "done":
+            text += f" ({len(self.image_urls)}{' saved' if self.reused else ''})"
+        return text
+
+
+class PromptGenerationThread(QThread):
+    """Thread for generating prompts with Ollama without blocking the UI"""
+    finished = pyqtSignal(str)
+    error = pyqtSignal(str)
+    status = pyqtSignal(str)
+    token = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    
+    def __init__(self, model, phrase, style, additional_info="", stream=False,
+                 max_tokens=0, deadline_seconds=0, cache=None, force=False, store=True,
+                 cancel_token=None):
+        super().__init__()
+        self.model = model
+        self.phrase = phrase
+        self.style = style
+        self.additional_info = additional_info
+        self.stream = stream
+        self.max_tokens = max_tokens
+        self.deadline_seconds = deadline_seconds
+        self.cache = cache
+        self.force = force
+        # Speculative prompts are only stored once a job actually uses them
+        self.store = store
+        self.complete = False
+        self.cached = False
+        # The job's CancelToken and deadline; may be attached later when a
+        # job adopts a speculative thread
+        self.cancel_token = cancel_token
+        self.started_at = None
+        self.stop_event = threading.Event()
+        # Tokens streamed so far; the lock lets an adopting job take them
+        # and connect to token without missing or repeating one
+        self.streamed = []
+        self.stream_lock = threading.Lock()
+    
+    def cancel(self):
+        """Ask the thread to stop at the next streamed chunk"""
+        self.stop_event.set()
+    
+    def should_stop(self):
+        return self.stop_event.is_set() or (
+            self.cancel_token is not None and self.cancel_token.is_cancelled()
+        )
+    
+    def deadline(self):
+        if not self.deadline_seconds or self.started_at is None:
+            return None
+        return self.started_at + self.deadline_seconds
+    
+    def emit_token(self, token):
+        with self.stream_lock:
+            self.streamed.append(token)
+            self.token.emit(token)
+    
+    def run(self):
+        if self.model == DIRECT_PROMPT_MODEL:
+            self.complete = True
+            self.finished.emit(direct_prompt(self.phrase, self.style, self.additional_info))
+            return
+        
+        key = (self.model, self.phrase, self.style, self.additional_info)
+        if self.cache is not None and not self.force:
+            cached = self.cache.get(*key)
+            if cached:
+                self.complete = True
+                self.cached = True
+                self.status.emit(f"Using cached prompt for '{self.phrase}'")
+                self.finished.emit(cached)
+                return
+        
+        fallback = direct_prompt(self.phrase, self.style, self.additional_info)
+        complete = False
+        try:
+            self.status.emit(f"Generating prompt for '{self.phrase}' with {self.model}...")
+            if self.stream:
+                self.started_at = time.monotonic()
+                result, reason = ollama_stream_prompt(
+                    self.model, self.phrase, self.style, self.additional_info,
+                    on_token=self.emit_token,
+                    should_stop=self.should_stop,
+                    max_tokens=self.max_tokens,
+                    deadline=self.deadline
+                )
+                if reason == "cancelled":
+                    self.cancelled.emit()
+                    return
+                if reason != "done":
+                    self.status.emit(f"Prompt stopped early ({reason.replace('_', ' ')} budget reached)")
+                complete = reason == "done"
+            else:
+                timeout = self.cancel_token.timeout(30) if self.cancel_token is not None else 30
+                result = ollama_generate_prompt(self.model, self.phrase, self.style, self.additional_info,
+                                                timeout=timeout)
+                complete = True
+            if not result:
+                raise RuntimeError("Ollama returned an empty prompt")
+            self.status.emit(f"Generated prompt with {self.model}")
+            self.complete = complete
+            # Truncated prompts are used once but never cached
+            if self.cache is not None and complete and self.store:
+                self.cache.put(*key, result)
+        except JobCancelled:
+            self.cancelled.emit()
+            return
+        except RuntimeError:
+            self.error.emit("Ollama generation failed, using direct prompt")
+            result = fallback
+        except Exception as e:
+            if self.should_stop():
+                self.cancelled.emit()
+                return
+            self.error.emit(f"Ollama error: {str(e)}, using direct prompt")
+            result = fallback
+        if self.should_stop():
+            self.cancelled.emit()
+            return
+        self.finished.emit(result)
 
 
 class ImageGenerationThread(QThread):
@@ -72,32 +2943,405 @@ class ImageGenerationThread(QThread):
     finished = pyqtSignal(list)
     error = pyqtSignal(str)
     status = pyqtSignal(str)
+    cancelled = pyqtSignal(str)
     
-    def __init__(self, generator, prompt, num_images):
+    def __init__(self, scheduler, prompt, num_images, priority=PRIORITY_INTERACTIVE,
+                 cancel_token=None):
         super().__init__()
-        self.generator = generator
+        self.scheduler = scheduler
         self.prompt = prompt
         self.num_images = num_images
+        self.priority = priority
+        self.cancel_token = cancel_token
     
     def run(self):
         try:
             self.status.emit(f"Generating {self.num_images} image(s)...")
-            images = self.generator.generate(prompt=self.prompt, num_images=self.num_images)
-            # Extract image URLs from the response
-            image_urls = []
-            if isinstance(images, list):
-                for img in images:
-                    if isinstance(img, dict) and 'url' in img:
-                        image_urls.append(img['url'])
-                    elif isinstance(img, str):
-                        image_urls.append(img)
-            self.finished.emit(image_urls)
+            future = self.scheduler.submit(
+                self.prompt, self.num_images, self.priority, on_status=self.status.emit,
+                token=self.cancel_token
+            )
+            self.finished.emit(wait_for_result(future, self.cancel_token))
+        except JobCancelled as e:
+            self.cancelled.emit(str(e))
         except Exception as e:
             self.error.emit(str(e))
 
 
+class ImageSaveThread(QThread):
+    """Thread for writing images to the Output directory without blocking the UI
+    
+    Items are (url, data, phrase, style, prompt) tuples; data may be None
+    for images that still have to be fetched. Images are fetched and hashed
+    concurrently, checked against the hash index one by one, then written
+    concurrently with atomic_write. All log entries are committed in one
+    transaction. Once finished, written lists (filename, phrase, style,
+    prompt) for every image that was saved.
+    """
+    saved = pyqtSignal(str)
+    failed = pyqtSignal(str, str)
+    duplicate = pyqtSignal(str, int, bool)
+    finished = pyqtSignal(int, int, float)
+    
+    def __init__(self, items, image_cache, output_catalog, generation_log, hash_index,
+                 output_dir=OUTPUT_DIR, skip_duplicates=True, max_workers=4):
+        super().__init__()
+        self.items = items
+        self.image_cache = image_cache
+        self.output_catalog = output_catalog
+        self.generation_log = generation_log
+        self.hash_index = hash_index
+        self.output_dir = Path(output_dir)
+        self.skip_duplicates = skip_duplicates
+        self.max_workers = max_workers
+        self.written = []
+    
+    def load(self, item):
+        """Return the item's bytes and their dHash (None if undecodable)"""
+        url, data, *_ = item
+        if data is None:
+            data = self.image_cache.fetch(url)
+        try:
+            with METRICS.span("dhash"):
+                value = dhash_bytes(data)
+        except ValueError:
+            value = None
+        return data, value
+    
+    def write(self, filename, data):
+        with METRICS.span("file_write"):
+            with self.output_catalog.writing():
+                atomic_write(self.output_dir / filename, data)
+        return len(data)
+    
+    def claim(self, item, value):
+        """Allocate a filename, or return None for a skipped near-duplicate"""
+        _, _, phrase, style, _ = item
+        allocate = partial(self.output_catalog.allocate, phrase, style)
+        if value is None:
+            return allocate()
+        skip_within = DEDUP_MAX_DISTANCE if self.skip_duplicates else -1
+        filename, nearest, distance = self.hash_index.claim(value, allocate, skip_within)
+        if nearest is not None and distance <= DEDUP_MAX_DISTANCE:
+            self.duplicate.emit(nearest, distance, filename is not None)
+        return filename
+    
+    def run(self):
+        started = time.perf_counter()
+        written = []
+        total_bytes = 0
+        workers = max(1, min(self.max_workers, len(self.items)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            loads = [pool.submit(self.load, item) for item in self.items]
+            # Claims run in item order so counters follow the order of the
+            # items and each claim sees the ones before it
+            writes = []
+            for item, future in zip(self.items, loads):
+                try:
+                    data, value = future.result()
+                    self.output_dir.mkdir(parents=True, exist_ok=True)
+                    filename = self.claim(item, value)
+                except Exception as e:
+                    self.failed.emit(item[0], str(e))
+                    continue
+                if filename is not None:
+                    writes.append((item, filename, pool.submit(self.write, filename, data)))
+            for item, filename, future in writes:
+                try:
+                    total_bytes += future.result()
+                except Exception as e:
+                    self.hash_index.remove(filename)
+                    self.failed.emit(filename, str(e))
+                    continue
+                written.append((item, filename))
+        
+        if written:
+            self.output_catalog.record(*[name for _, name in written])
+            try:
+                self.generation_log.append([
+                    make_log_entry(phrase, style, prompt, name)
+                    for (_, _, phrase, style, prompt), name in written
+                ])
+            except Exception as e:
+                self.failed.emit(str(self.generation_log.path), str(e))
+            for _, name in written:
+                self.saved.emit(name)
+            self.written = [(name, phrase, style, prompt)
+                            for (_, _, phrase, style, prompt), name in written]
+        self.finished.emit(len(written), total_bytes, time.perf_counter() - started)
+
+
+class MetricsPanel(QWidget):
+    """Window showing p50/p95 latency per pipeline stage and Ollama model"""
+    
+    def __init__(self, metrics, parent=None):
+        super().__init__(parent, Qt.WindowType.Window)
+        self.metrics = metrics
+        self.setWindowTitle("Pipeline Metrics")
+        self.resize(640, 360)
+        
+        layout = QVBoxLayout(self)
+        self.table = QTableWidget(0, 5)
+        self.table.setHorizontalHeaderLabels(["Stage", "Model", "Count", "p50 (ms)", "p95 (ms)"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        layout.addWidget(self.table)
+        
+        button_layout = QHBoxLayout()
+        self.trace_btn = QPushButton("Export Chrome Trace")
+        self.trace_btn.clicked.connect(self.export_chrome_trace)
+        button_layout.addWidget(self.trace_btn)
+        
+        self.prometheus_btn = QPushButton("Export Prometheus")
+        self.prometheus_btn.clicked.connect(self.export_prometheus)
+        button_layout.addWidget(self.prometheus_btn)
+        button_layout.addStretch()
+        layout.addLayout(button_layout)
+        
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.refresh)
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.refresh_timer.start()
+    
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.refresh_timer.stop()
+    
+    def refresh(self):
+        """Reload the latency table from the collected spans"""
+        summary = self.metrics.summary()
+        self.table.setRowCount(len(summary))
+        for row, ((stage, model), (count, _, p50, p95)) in enumerate(summary.items()):
+            values = [stage, model, str(count), f"{p50 * 1000:.1f}", f"{p95 * 1000:.1f}"]
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(value))
+    
+    def export_chrome_trace(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Chrome Trace", "trace.json", "JSON (*.json)")
+        if path:
+            self.metrics.export_chrome_trace(path)
+    
+    def export_prometheus(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Prometheus Metrics", "metrics.prom",
+                                              "Prometheus (*.prom *.txt)")
+        if path:
+            self.metrics.export_prometheus(path)
+
+
+class GalleryModel(QAbstractListModel):
+    """List model over the generation log for the gallery view
+    
+    Rows are fetched a page at a time as the view scrolls (canFetchMore /
+    fetchMore), and thumbnails are only requested from the data() calls the
+    view makes for visible items. They load on a thread pool, most recently
+    requested first, and are kept in a bounded LRU of pixmaps.
+    """
+    PAGE_SIZE = 500
+    
+    def __init__(self, generation_log, thumbnails, parent=None, max_pixmaps=2000):
+        super().__init__(parent)
+        self.generation_log = generation_log
+        self.thumbnails = thumbnails
+        self.filters = {}
+        self.entries = []
+        self.rows = {}
+        self.exhausted = False
+        self.pixmaps = OrderedDict()
+        self.max_pixmaps = max_pixmaps
+        self.pending = set()
+        self.requests = itertools.count()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(2)
+        self.signals = ThumbnailSignals()
+        self.signals.loaded.connect(self.on_thumbnail)
+        self.placeholder = QPixmap(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        self.placeholder.fill(Qt.GlobalColor.lightGray)
+    
+    def set_filters(self, **filters):
+        """Restart the listing with new query() filters"""
+        self.beginResetModel()
+        self.filters = filters
+        self.entries = []
+        self.rows = {}
+        self.exhausted = False
+        # Thumbnails requested for the old listing are no longer wanted
+        self.pool.clear()
+        self.pending.clear()
+        self.endResetModel()
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+    
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+    
+    def fetchMore(self, parent=QModelIndex()):
+        before_id = self.entries[-1]["id"] if self.entries else None
+        with METRICS.span("gallery_page"):
+            page = self.generation_log.query(limit=self.PAGE_SIZE, before_id=before_id, **self.filters)
+        self.exhausted = len(page) < self.PAGE_SIZE
+        if not page:
+            return
+        start = len(self.entries)
+        self.beginInsertRows(QModelIndex(), start, start + len(page) - 1)
+        self.entries.extend(page)
+        for row, entry in enumerate(page, start):
+            self.rows.setdefault(entry["filename"], []).append(row)
+        self.endInsertRows()
+    
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self.entries[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return entry["word_phrase"]
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return (f"{entry['word_phrase']}\n{entry['style']} - {entry['date_time']}\n"
+                    f"{entry['filename']}\n\n{entry['ai_generated_prompt']}")
+        if role == Qt.ItemDataRole.DecorationRole:
+            pixmap = self.pixmaps.get(entry["filename"])
+            if pixmap is None:
+                self.request(entry["filename"])
+                return self.placeholder
+            self.pixmaps.move_to_end(entry["filename"])
+            return pixmap
+        return None
+    
+    def request(self, filename):
+        if filename in self.pending:
+            return
+        self.pending.add(filename)
+        # Later requests are for what is on screen now, so they go first
+        self.pool.start(ThumbnailTask(self.signals, self.thumbnails, filename),
+                        next(self.requests) % (1 << 30))
+    
+    def on_thumbnail(self, filename, image):
+        if filename not in self.pending:
+            return
+        self.pending.discard(filename)
+        if image.isNull():
+            pixmap = QPixmap(self.placeholder)
+            pixmap.fill(Qt.GlobalColor.darkGray)
+        else:
+            pixmap = QPixmap.fromImage(image)
+        self.pixmaps[filename] = pixmap
+        while len(self.pixmaps) > self.max_pixmaps:
+            self.pixmaps.popitem(last=False)
+        for row in self.rows.get(filename, []):
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+    
+    def filename(self, index):
+        return self.entries[index.row()]["filename"]
+
+
+class GalleryPanel(QWidget):
+    """Window for browsing saved images, filtered by phrase, style and date"""
+    DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+    
+    def __init__(self, generation_log, thumbnails, parent=None):
+        super().__init__(parent, Qt.WindowType.Window)
+        self.generation_log = generation_log
+        self.setWindowTitle("Gallery")
+        self.resize(900, 700)
+        
+        layout = QVBoxLayout(self)
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Phrase:"))
+        self.phrase_filter = QLineEdit()
+        self.phrase_filter.setPlaceholderText("starts with...")
+        filter_layout.addWidget(self.phrase_filter)
+        
+        filter_layout.addWidget(QLabel("Style:"))
+        self.style_filter = QComboBox()
+        filter_layout.addWidget(self.style_filter)
+        
+        filter_layout.addWidget(QLabel("From:"))
+        self.date_from_filter = QLineEdit()
+        self.date_from_filter.setPlaceholderText("YYYY-MM-DD")
+        filter_layout.addWidget(self.date_from_filter)
+        
+        filter_layout.addWidget(QLabel("To:"))
+        self.date_to_filter = QLineEdit()
+        self.date_to_filter.setPlaceholderText("YYYY-MM-DD")
+        filter_layout.addWidget(self.date_to_filter)
+        
+        self.count_label = QLabel()
+        filter_layout.addWidget(self.count_label)
+        layout.addLayout(filter_layout)
+        
+        self.model = GalleryModel(generation_log, thumbnails, self)
+        self.view = QListView()
+        self.view.setViewMode(QListView.ViewMode.IconMode)
+        self.view.setMovement(QListView.Movement.Static)
+        self.view.setResizeMode(QListView.ResizeMode.Adjust)
+        self.view.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.view.setGridSize(QSize(THUMBNAIL_SIZE + 24, THUMBNAIL_SIZE + 40))
+        self.view.setUniformItemSizes(True)
+        self.view.setLayoutMode(QListView.LayoutMode.Batched)
+        self.view.setBatchSize(200)
+        self.view.setModel(self.model)
+        self.view.doubleClicked.connect(self.open_image)
+        layout.addWidget(self.view)
+        
+        # Typing restarts the timer so the query runs once typing pauses
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(150)
+        self.filter_timer.timeout.connect(self.apply_filters)
+        for line_edit in (self.phrase_filter, self.date_from_filter, self.date_to_filter):
+            line_edit.textChanged.connect(self.filter_timer.start)
+        self.style_filter.currentIndexChanged.connect(self.filter_timer.start)
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+    
+    def refresh(self):
+        """Reload the style list and the listing, e.g. after new saves"""
+        current = self.style_filter.currentData()
+        self.style_filter.blockSignals(True)
+        self.style_filter.clear()
+        self.style_filter.addItem("All", None)
+        for style in self.generation_log.styles():
+            self.style_filter.addItem(style, style)
+        index = self.style_filter.findData(current)
+        self.style_filter.setCurrentIndex(max(index, 0))
+        self.style_filter.blockSignals(False)
+        self.apply_filters()
+    
+    def filters(self):
+        filters = {}
+        phrase = self.phrase_filter.text().strip()
+        if phrase:
+            filters["phrase"] = unicodedata.normalize("NFC", phrase)
+        if self.style_filter.currentData():
+            filters["style"] = self.style_filter.currentData()
+        for key, line_edit in (("date_from", self.date_from_filter), ("date_to", self.date_to_filter)):
+            text = line_edit.text().strip()
+            valid = not text or bool(self.DATE_RE.match(text))
+            line_edit.setStyleSheet("" if valid else "color: red;")
+            if text and valid:
+                filters[key] = text
+        return filters
+    
+    def apply_filters(self):
+        filters = self.filters()
+        self.model.set_filters(**filters)
+        self.count_label.setText(f"{self.generation_log.count(**filters)} image(s)")
+    
+    def open_image(self, index):
+        """Open a saved image in the system viewer"""
+        path = self.model.thumbnails.output_dir / self.model.filename(index)
+        QDesktopServices.openUrl(QUrl.fromLocalFile(str(path.resolve())))
+
+
 class BingImageCreatorGUI(QMainWindow):
-    def __init__(self):
+    def __init__(self, accounts_file=None):
         super().__init__()
         self.setWindowTitle("Bing Image Creator GUI")
         self.setMinimumSize(900, 1000)
@@ -105,15 +3349,97 @@ class BingImageCreatorGUI(QMainWindow):
         self.current_images = []
         self.current_image_index = 0
         self.current_image_data = None
-        self.image_counter = 1
         self.generator = None
+        # One worker per possible concurrent job; the token bucket still
+        # paces the requests that actually reach Bing
+        self.scheduler = GenerationScheduler(workers=MAX_CONCURRENT_JOBS)
+        self.accounts_file = Path(accounts_file) if accounts_file else ACCOUNTS_FILE
+        self.cookie_pool = None
         self.current_phrase = ""
         self.current_style = ""
         self.current_prompt = ""
-        self.log_file = Path("Output") / "generation_log.json"
+        with startup_step("open generation log"):
+            self.generation_log = GenerationLog()
+        with startup_step("sync output catalog"):
+            self.output_catalog = OutputCatalog()
+        with startup_step("open prompt cache"):
+            self.prompt_cache = PromptCache()
+        with startup_step("open image cache"):
+            self.image_cache = ImageCache()
+        self.hash_index = HashIndex()
+        # Saved images each displayed image resembles, by content hash
+        self.near_duplicates = {}
+        self.prefetcher = ImagePrefetcher(self.image_cache)
+        self.prefetcher.loaded.connect(self.on_image_loaded)
+        self.prefetcher.failed.connect(self.on_image_failed)
+        
+        # Decoding and scaling happen on a worker pool; scaled results are
+        # cached by (content hash, width, height)
+        self.render_pool = QThreadPool()
+        self.render_pool.setMaxThreadCount(2)
+        self.render_signals = ImageRenderSignals()
+        self.render_signals.rendered.connect(self.on_image_rendered)
+        self.render_signals.failed.connect(self.on_image_render_failed)
+        self.render_signals.duplicate.connect(self.on_image_duplicate)
+        self.decoded_images = QImageCache(64 * 1024 * 1024)
+        self.scaled_images = QImageCache(64 * 1024 * 1024)
+        self.pending_renders = set()
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(150)
+        self.resize_timer.timeout.connect(self.display_current_image)
         
-        self.init_ui()
+        # All jobs of the session in submission order. One prompt is
+        # generated at a time, ahead of up to max_jobs concurrent Bing jobs
+        self.jobs = []
+        self.prompt_thread = None
+        self.prompt_job = None
+        self.displayed_job = None
+        
+        # Speculative prompt for the current inputs, started once typing
+        # pauses. Cancelled threads are kept until they have returned
+        self.speculative_key = None
+        self.speculative_thread = None
+        self.speculative_prompt = None
+        self.speculative_cached = False
+        self.stale_speculations = []
+        self.last_submitted_key = None
+        # Prompt threads of cancelled jobs, kept until they have returned
+        self.detached_threads = []
+        # Background writers of Save / Save All
+        self.save_threads = []
+        # Process pool for Post-Process, started on first use
+        self.postprocessor = None
+        self.postprocess_notifier = None
+        self.speculation_timer = QTimer(self)
+        self.speculation_timer.setSingleShot(True)
+        self.speculation_timer.setInterval(700)
+        self.speculation_timer.timeout.connect(self.start_speculation)
+        
+        # Selected Ollama models are loaded ahead of the first prompt. The
+        # timer coalesces the selection churn of a model list refresh
+        self.warmup_thread = None
+        self.model_loaded_until = {}
+        self.model_load_seconds = {}
+        self.warmup_timer = QTimer(self)
+        self.warmup_timer.setSingleShot(True)
+        self.warmup_timer.setInterval(300)
+        self.warmup_timer.timeout.connect(self.warm_selected_model)
+        self.model_expiry_timer = QTimer(self)
+        self.model_expiry_timer.setSingleShot(True)
+        self.model_expiry_timer.timeout.connect(self.update_model_state_label)
+        self.models_thread = None
+        # Similar-images index; opened once the Ollama models are known
+        self.embedding_index = None
+        self.embedding_thread = None
+        self.embedding_stale = False
+        self.metrics_panel = None
+        self.gallery_panel = None
+        
+        with startup_step("build UI"):
+            self.init_ui()
         self.load_environment_vars()
+        self.load_accounts()
     
     def init_ui(self):
         main_widget = QWidget()
@@ -182,14 +3508,56 @@ class BingImageCreatorGUI(QMainWindow):
         ollama_layout = QHBoxLayout()
         ollama_layout.addWidget(QLabel("Ollama Model:"))
         self.ollama_combo = QComboBox()
-        self.ollama_combo.addItem("None (Direct prompt)")
+        self.ollama_combo.addItem(DIRECT_PROMPT_MODEL)
         ollama_layout.addWidget(self.ollama_combo)
         
+        self.model_state_label = QLabel("")
+        ollama_layout.addWidget(self.model_state_label)
+        
         self.refresh_ollama_btn = QPushButton("Refresh Models")
         self.refresh_ollama_btn.clicked.connect(self.refresh_ollama_models)
         ollama_layout.addWidget(self.refresh_ollama_btn)
         prompt_layout.addLayout(ollama_layout)
         
+        # Streaming options
+        stream_layout = QHBoxLayout()
+        self.stream_checkbox = QCheckBox("Stream Response")
+        self.stream_checkbox.setChecked(True)
+        stream_layout.addWidget(self.stream_checkbox)
+        
+        stream_layout.addWidget(QLabel("Max Tokens:"))
+        self.max_tokens_spin = QSpinBox()
+        self.max_tokens_spin.setRange(0, 4096)
+        self.max_tokens_spin.setValue(300)
+        self.max_tokens_spin.setSpecialValueText("Unlimited")
+        stream_layout.addWidget(self.max_tokens_spin)
+        
+        stream_layout.addWidget(QLabel("Deadline (s):"))
+        self.prompt_deadline_spin = QSpinBox()
+        self.prompt_deadline_spin.setRange(0, 600)
+        self.prompt_deadline_spin.setValue(60)
+        self.prompt_deadline_spin.setSpecialValueText("None")
+        stream_layout.addWidget(self.prompt_deadline_spin)
+        
+        self.force_regenerate_checkbox = QCheckBox("Force Regenerate")
+        self.force_regenerate_checkbox.setToolTip("Ignore cached prompts and ask Ollama for a new variant")
+        stream_layout.addWidget(self.force_regenerate_checkbox)
+        
+        self.speculate_checkbox = QCheckBox("Pre-generate While Typing")
+        self.speculate_checkbox.setChecked(True)
+        self.speculate_checkbox.setToolTip(
+            "Generate the prompt in the background once typing pauses, so Generate can use it at once"
+        )
+        stream_layout.addWidget(self.speculate_checkbox)
+        
+        stream_layout.addStretch()
+        
+        self.cancel_prompt_btn = QPushButton("Cancel Prompt")
+        self.cancel_prompt_btn.clicked.connect(self.cancel_prompt)
+        self.cancel_prompt_btn.setEnabled(False)
+        stream_layout.addWidget(self.cancel_prompt_btn)
+        prompt_layout.addLayout(stream_layout)
+        
         # Generated prompt display
         prompt_display_layout = QVBoxLayout()
         prompt_display_layout.addWidget(QLabel("Generated Prompt:"))
@@ -241,12 +3609,40 @@ class BingImageCreatorGUI(QMainWindow):
         self.image_status_label.setStyleSheet("color: green; font-weight: bold;")
         controls_layout.addWidget(self.image_status_label)
         
+        self.cache_status_label = QLabel(self.prompt_cache.stats_text())
+        controls_layout.addWidget(self.cache_status_label)
+        
+        self.http_status_label = QLabel("HTTP: idle")
+        controls_layout.addWidget(self.http_status_label)
+        
         controls_layout.addStretch()
         
         self.generate_btn = QPushButton("Generate Images")
         self.generate_btn.clicked.connect(self.generate_images)
         controls_layout.addWidget(self.generate_btn)
         
+        self.reuse_checkbox = QCheckBox("Offer Saved Matches")
+        self.reuse_checkbox.setChecked(True)
+        self.reuse_checkbox.setToolTip(
+            "Before generating, look for saved images of similar phrases in the same style"
+        )
+        controls_layout.addWidget(self.reuse_checkbox)
+        
+        controls_layout.addWidget(QLabel("Concurrent Jobs:"))
+        self.max_jobs_spin = QSpinBox()
+        self.max_jobs_spin.setRange(1, MAX_CONCURRENT_JOBS)
+        self.max_jobs_spin.setValue(2)
+        self.max_jobs_spin.valueChanged.connect(self.pump_jobs)
+        controls_layout.addWidget(self.max_jobs_spin)
+        
+        controls_layout.addWidget(QLabel("Job Deadline (min):"))
+        self.job_deadline_spin = QSpinBox()
+        self.job_deadline_spin.setRange(0, 240)
+        self.job_deadline_spin.setValue(10)
+        self.job_deadline_spin.setSpecialValueText("None")
+        self.job_deadline_spin.setToolTip("Give up on a job that has not finished this long after it was queued")
+        controls_layout.addWidget(self.job_deadline_spin)
+        
         controls_group.setLayout(controls_layout)
         layout.addWidget(controls_group)
         
@@ -261,7 +3657,35 @@ class BingImageCreatorGUI(QMainWindow):
         self.image_label.setStyleSheet("QLabel { background-color: #f0f0f0; border: 1px solid #ccc; }")
         self.image_label.setText("No image loaded")
         self.image_label.setScaledContents(False)
-        preview_layout.addWidget(self.image_label)
+        
+        # Job list beside the preview; the preview follows the selection
+        image_row = QHBoxLayout()
+        self.job_list = QListWidget()
+        self.job_list.setMaximumWidth(260)
+        self.job_list.currentItemChanged.connect(self.on_job_selected)
+        job_column = QVBoxLayout()
+        job_column.addWidget(self.job_list)
+        # Saved matches are offered on the selected job, not in a dialog,
+        # so other jobs keep running while the user decides
+        offer_layout = QHBoxLayout()
+        self.use_saved_btn = QPushButton("Use Saved")
+        self.use_saved_btn.setToolTip("Finish the selected job with the saved images it matches")
+        self.use_saved_btn.clicked.connect(self.use_selected_matches)
+        self.use_saved_btn.setEnabled(False)
+        offer_layout.addWidget(self.use_saved_btn)
+        self.generate_anyway_btn = QPushButton("Generate Anyway")
+        self.generate_anyway_btn.setToolTip("Generate new images for the selected job")
+        self.generate_anyway_btn.clicked.connect(self.decline_selected_matches)
+        self.generate_anyway_btn.setEnabled(False)
+        offer_layout.addWidget(self.generate_anyway_btn)
+        job_column.addLayout(offer_layout)
+        self.cancel_job_btn = QPushButton("Cancel Job")
+        self.cancel_job_btn.setMaximumWidth(260)
+        self.cancel_job_btn.clicked.connect(self.cancel_selected_job)
+        job_column.addWidget(self.cancel_job_btn)
+        image_row.addLayout(job_column)
+        image_row.addWidget(self.image_label)
+        preview_layout.addLayout(image_row)
         
         # Navigation buttons
         nav_layout = QHBoxLayout()
@@ -287,6 +3711,43 @@ class BingImageCreatorGUI(QMainWindow):
         self.save_btn.setEnabled(False)
         action_layout.addWidget(self.save_btn)
         
+        self.save_all_btn = QPushButton("Save All")
+        self.save_all_btn.clicked.connect(self.save_all_images)
+        self.save_all_btn.setEnabled(False)
+        action_layout.addWidget(self.save_all_btn)
+        
+        self.skip_duplicates_checkbox = QCheckBox("Skip Near-Duplicates")
+        self.skip_duplicates_checkbox.setChecked(True)
+        self.skip_duplicates_checkbox.setToolTip(
+            "Do not save images that look almost the same as an image already in Output"
+        )
+        action_layout.addWidget(self.skip_duplicates_checkbox)
+        
+        self.postprocess_checkbox = QCheckBox("Post-Process")
+        self.postprocess_checkbox.setToolTip(
+            "Re-encode saved images as JPEG with the phrase, style and prompt embedded, "
+            "and write web and print size variants"
+        )
+        self.jpeg_quality_spin = QSpinBox()
+        self.jpeg_quality_spin.setRange(50, 100)
+        self.jpeg_quality_spin.setValue(JPEG_QUALITY)
+        self.jpeg_quality_spin.setPrefix("Quality ")
+        self.jpeg_quality_spin.setToolTip("JPEG quality of post-processed images")
+        if not pillow_available():
+            self.postprocess_checkbox.setEnabled(False)
+            self.postprocess_checkbox.setToolTip("Install Pillow to enable post-processing")
+            self.jpeg_quality_spin.setEnabled(False)
+        action_layout.addWidget(self.postprocess_checkbox)
+        action_layout.addWidget(self.jpeg_quality_spin)
+        
+        self.gallery_btn = QPushButton("Gallery")
+        self.gallery_btn.clicked.connect(self.show_gallery)
+        action_layout.addWidget(self.gallery_btn)
+        
+        self.metrics_btn = QPushButton("Metrics")
+        self.metrics_btn.clicked.connect(self.show_metrics)
+        action_layout.addWidget(self.metrics_btn)
+        
         self.exit_btn = QPushButton("Exit")
         self.exit_btn.clicked.connect(self.close)
         action_layout.addWidget(self.exit_btn)
@@ -303,8 +3764,18 @@ class BingImageCreatorGUI(QMainWindow):
         layout.addWidget(QLabel("Status:"))
         layout.addWidget(self.status_text)
         
-        # Initialize Ollama models
-        self.refresh_ollama_models()
+        # Restart speculative prompt generation whenever its inputs change
+        self.phrase_input.textChanged.connect(self.schedule_speculation)
+        self.additional_info_input.textChanged.connect(self.schedule_speculation)
+        self.custom_style_input.textChanged.connect(self.schedule_speculation)
+        self.style_combo.currentIndexChanged.connect(self.schedule_speculation)
+        self.ollama_combo.currentIndexChanged.connect(self.schedule_speculation)
+        self.ollama_combo.currentTextChanged.connect(self.warmup_timer.start)
+        self.force_regenerate_checkbox.toggled.connect(self.schedule_speculation)
+        self.speculate_checkbox.toggled.connect(self.schedule_speculation)
+        
+        # Discover Ollama models in the background once the window is up
+        QTimer.singleShot(0, self.refresh_ollama_models)
     
     def populate_styles(self):
         """Populate the style combo box with categorized styles"""
@@ -333,6 +3804,19 @@ class BingImageCreatorGUI(QMainWindow):
         else:
             self.log_status("No environment variables found. Please enter cookies manually.")
     
+    def load_accounts(self):
+        """Use the multi-account cookie pool when an accounts file exists"""
+        if not self.accounts_file.exists():
+            return
+        try:
+            self.cookie_pool = CookiePool.from_file(self.accounts_file)
+        except Exception as e:
+            self.log_error(f"Failed to load {self.accounts_file}: {str(e)}")
+            return
+        self.scheduler.pool = self.cookie_pool
+        self.log_status(f"Loaded {len(self.cookie_pool.accounts)} Bing account(s) from {self.accounts_file}")
+        self.update_bing_status(True)
+    
     def validate_cookies(self):
         """Validate the provided cookies"""
         u_cookie = self.u_cookie_input.text().strip()
@@ -345,7 +3829,7 @@ class BingImageCreatorGUI(QMainWindow):
         
         try:
             # Test by creating an ImageGenerator instance
-            self.generator = ImageGenerator(
+            self.generator = load_image_generator()(
                 auth_cookie_u=u_cookie,
                 auth_cookie_srchhpgusr=srchhpgusr
             )
@@ -371,214 +3855,827 @@ class BingImageCreatorGUI(QMainWindow):
         self.log_status("Environment variables updated for this session")
     
     def refresh_ollama_models(self):
-        """Refresh the list of available Ollama models"""
-        try:
-            response = requests.get("http://localhost:11434/api/tags", timeout=2)
-            if response.status_code == 200:
-                models = response.json().get("models", [])
-                current_text = self.ollama_combo.currentText()
-                
-                self.ollama_combo.clear()
-                self.ollama_combo.addItem("None (Direct prompt)")
-                
-                for model in models:
-                    self.ollama_combo.addItem(model["name"])
-                
-                # Restore selection if possible
-                index = self.ollama_combo.findText(current_text)
-                if index >= 0:
-                    self.ollama_combo.setCurrentIndex(index)
-                
-                self.log_status(f"Found {len(models)} Ollama model(s)")
-            else:
-                self.log_error("Failed to fetch Ollama models")
-        except requests.exceptions.RequestException:
-            self.log_status("Ollama not available (optional feature)")
+        """Refresh the list of available Ollama models in the background"""
+        if self.models_thread is not None:
+            return
+        self.refresh_ollama_btn.setEnabled(False)
+        self.models_thread = OllamaModelsThread()
+        self.models_thread.finished.connect(self.on_ollama_models)
+        self.models_thread.error.connect(self.on_ollama_models_error)
+        self.models_thread.unavailable.connect(self.on_ollama_unavailable)
+        self.models_thread.start()
     
-    def generate_prompt_with_ollama(self, phrase, style, additional_info=""):
-        """Generate an enhanced prompt using Ollama"""
-        model = self.ollama_combo.currentText()
+    def finish_models_thread(self):
+        self.models_thread.wait()
+        self.models_thread = None
+        self.refresh_ollama_btn.setEnabled(True)
+    
+    def on_ollama_models(self, models):
+        """Fill the model combo box with discovered models"""
+        self.finish_models_thread()
+        current_text = self.ollama_combo.currentText()
         
-        # Build base prompt
-        base_prompt = phrase
-        if additional_info:
-            base_prompt = f"{phrase}. Additional context: {additional_info}"
+        self.ollama_combo.clear()
+        self.ollama_combo.addItem(DIRECT_PROMPT_MODEL)
         
-        if model == "None (Direct prompt)":
-            # Set to working briefly for consistency
-            self.update_prompt_status("working")
-            QApplication.processEvents()
-            
-            result = f"{base_prompt}, {style}"
-            
-            self.update_prompt_status("done")
-            QApplication.processEvents()
-            return result
+        for model in models:
+            self.ollama_combo.addItem(model)
+        
+        # Restore selection if possible
+        index = self.ollama_combo.findText(current_text)
+        if index >= 0:
+            self.ollama_combo.setCurrentIndex(index)
         
+        self.log_status(f"Found {len(models)} Ollama model(s)")
+        if any(model.split(":")[0] == EMBEDDING_MODEL for model in models):
+            self.open_embedding_index(OllamaEmbedder(EMBEDDING_MODEL))
+        else:
+            self.open_embedding_index(HashingEmbedder())
+    
+    def on_ollama_models_error(self, error_msg):
+        self.finish_models_thread()
+        self.log_error(error_msg)
+        self.open_embedding_index(HashingEmbedder())
+    
+    def on_ollama_unavailable(self):
+        self.finish_models_thread()
+        self.log_status("Ollama not available (optional feature)")
+        self.open_embedding_index(HashingEmbedder())
+    
+    def open_embedding_index(self, embedder):
+        """Switch the similar-images index to embedder and sync it in the background"""
+        if self.embedding_index is not None and self.embedding_index.embedder.name == embedder.name:
+            self.sync_embedding_index()
+            return
         try:
-            # Set to working (Red) and force update UI before blocking call
-            self.update_prompt_status("working")
-            QApplication.processEvents()
-            
-            prompt = f"Create a detailed image generation prompt for: '{base_prompt}' in {style} style. Only respond with the prompt, no explanations."
-            
-            response = requests.post(
-                "http://localhost:11434/api/generate",
-                json={
-                    "model": model,
-                    "prompt": prompt,
-                    "stream": False
-                },
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json().get("response", "").strip()
-                self.log_status(f"Generated prompt with {model}")
-                self.update_prompt_status("done")
-                QApplication.processEvents()
-                return result
-            else:
-                self.log_error("Ollama generation failed, using direct prompt")
-                self.update_prompt_status("done")
-                QApplication.processEvents()
-                return f"{base_prompt}, {style}"
+            self.embedding_index = EmbeddingIndex(embedder)
         except Exception as e:
-            self.log_error(f"Ollama error: {str(e)}, using direct prompt")
-            self.update_prompt_status("done")
-            QApplication.processEvents()
-            return f"{base_prompt}, {style}"
+            self.log_error(f"Failed to open the similar-images index: {e}")
+            return
+        self.sync_embedding_index()
+    
+    def sync_embedding_index(self):
+        """Embed generation log entries added since the last sync"""
+        if self.embedding_index is None:
+            return
+        if self.embedding_thread is not None:
+            # Picked up again when the running sync finishes
+            self.embedding_stale = True
+            return
+        self.embedding_stale = False
+        self.embedding_thread = EmbeddingSyncThread(self.embedding_index, self.generation_log)
+        self.embedding_thread.finished.connect(self.on_embedding_synced)
+        self.embedding_thread.error.connect(self.on_embedding_sync_error)
+        self.embedding_thread.start()
+    
+    def on_embedding_synced(self, index, added):
+        self.embedding_thread.wait()
+        self.embedding_thread = None
+        if added:
+            self.log_status(f"Indexed {added} saved image(s) for reuse ({index.embedder.name})")
+        if self.embedding_stale:
+            self.sync_embedding_index()
+    
+    def on_embedding_sync_error(self, error_msg):
+        self.embedding_thread.wait()
+        self.embedding_thread = None
+        self.log_error(f"Failed to update the similar-images index: {error_msg}")
+    
+    def warm_selected_model(self):
+        """Load the selected Ollama model in the background"""
+        model = self.ollama_combo.currentText()
+        self.update_model_state_label()
+        if not model or model == DIRECT_PROMPT_MODEL or self.warmup_thread is not None:
+            return
+        if self.model_is_loaded(model):
+            return
+        
+        self.model_state_label.setText("◐ Loading...")
+        self.model_state_label.setStyleSheet("color: #FFA500; font-weight: bold;")
+        self.warmup_thread = OllamaWarmupThread(model)
+        self.warmup_thread.finished.connect(self.on_model_warmed)
+        self.warmup_thread.error.connect(self.on_model_warmup_error)
+        self.warmup_thread.start()
+    
+    def on_model_warmed(self, model, seconds):
+        self.warmup_thread.wait()
+        self.warmup_thread = None
+        self.model_load_seconds[model] = seconds
+        self.mark_model_loaded(model)
+        if seconds >= OLLAMA_COLD_LOAD_SECONDS:
+            self.log_status(f"Loaded {model} in {seconds:.1f}s")
+        # The selection may have changed while this model was loading
+        self.warm_selected_model()
+    
+    def on_model_warmup_error(self, model, error_msg):
+        self.warmup_thread.wait()
+        self.warmup_thread = None
+        self.model_loaded_until.pop(model, None)
+        self.log_error(f"Failed to load {model}: {error_msg}")
+        if self.ollama_combo.currentText() == model:
+            self.model_state_label.setText("● Not Loaded")
+            self.model_state_label.setStyleSheet("color: red; font-weight: bold;")
+        else:
+            self.warm_selected_model()
+    
+    def model_is_loaded(self, model):
+        if model not in self.model_loaded_until:
+            return False
+        until = self.model_loaded_until[model]
+        return until is None or time.monotonic() < until
+    
+    def mark_model_loaded(self, model):
+        """Remember that Ollama keeps the model loaded for the keep-alive period"""
+        seconds = keep_alive_seconds(OLLAMA_KEEP_ALIVE)
+        self.model_loaded_until[model] = None if seconds is None else time.monotonic() + seconds
+        if model == self.ollama_combo.currentText():
+            self.update_model_state_label()
+    
+    def update_model_state_label(self):
+        """Show whether the selected model is expected to be loaded"""
+        model = self.ollama_combo.currentText()
+        self.model_expiry_timer.stop()
+        if not model or model == DIRECT_PROMPT_MODEL:
+            self.model_state_label.setText("")
+            return
+        if not self.model_is_loaded(model):
+            self.model_state_label.setText("○ Not Loaded")
+            self.model_state_label.setStyleSheet("color: gray; font-weight: bold;")
+            return
+        
+        text = "● Loaded"
+        load_seconds = self.model_load_seconds.get(model, 0.0)
+        if load_seconds >= OLLAMA_COLD_LOAD_SECONDS:
+            text += f" (cold start {load_seconds:.1f}s)"
+        self.model_state_label.setText(text)
+        self.model_state_label.setStyleSheet("color: green; font-weight: bold;")
+        until = self.model_loaded_until[model]
+        if until is not None:
+            # Ollama unloads the model once keep-alive runs out without requests
+            self.model_expiry_timer.start(min(int((until - time.monotonic()) * 1000) + 1, 2 ** 31 - 1))
     
     def generate_images(self):
-        """Generate images using Bing Image Creator"""
+        """Queue a generation job for the current inputs"""
         phrase = self.phrase_input.text().strip()
         if not phrase:
             self.log_error("Please enter a word or phrase")
             return
         
-        u_cookie = self.u_cookie_input.text().strip()
-        srchhpgusr = self.srchhpgusr_input.text().strip()
+        if self.cookie_pool is not None:
+            if not self.cookie_pool.healthy_count():
+                self.log_error(f"No healthy Bing accounts left in {self.accounts_file}")
+                return
+        else:
+            u_cookie = self.u_cookie_input.text().strip()
+            srchhpgusr = self.srchhpgusr_input.text().strip()
+            
+            if not u_cookie or not srchhpgusr:
+                self.log_error("Please provide valid cookies")
+                return
+            
+            # Create ImageGenerator instance if not already created
+            try:
+                if not self.generator:
+                    self.generator = load_image_generator()(
+                        auth_cookie_u=u_cookie,
+                        auth_cookie_srchhpgusr=srchhpgusr
+                    )
+            except Exception as e:
+                self.log_error(f"Failed to initialize: {str(e)}")
+                self.update_prompt_status("ready")
+                self.update_image_status("ready")
+                return
+            if self.scheduler.pool is None or self.scheduler.pool.accounts[0].generator is not self.generator:
+                self.scheduler.pool = CookiePool.single(self.generator)
         
-        if not u_cookie or not srchhpgusr:
-            self.log_error("Please provide valid cookies")
+        job = GenerationJob(
+            phrase,
+            self.selected_style(),
+            self.additional_info_input.text().strip(),
+            self.ollama_combo.currentText(),
+            self.num_images_spin.value(),
+            timeout=self.job_deadline_spin.value() * 60
+        )
+        self.jobs.append(job)
+        self.last_submitted_key = self.prompt_key(job.model, job.phrase, job.style, job.additional_info)
+        if (self.reuse_checkbox.isChecked() and self.embedding_index is not None
+                and len(self.embedding_index)):
+            # Look for saved images first; the job is queued if none match
+            job.state = "matching"
+            job.thread = SimilarImagesThread(
+                self.embedding_index, f"{job.phrase} {job.additional_info}".strip(), job.style
+            )
+            job.thread.finished.connect(partial(self.on_similar_images, job))
+            job.thread.error.connect(partial(self.on_similar_images_error, job))
+            job.thread.start()
+        job.list_item = QListWidgetItem(job.label())
+        self.job_list.addItem(job.list_item)
+        if job.state == "matching":
             return
+        if self.running_jobs():
+            self.log_status(f"Queued '{phrase}' ({len(self.waiting_jobs())} waiting)")
         
         # Set initial status indicators - both start at waiting (yellow)
-        self.update_prompt_status("waiting")
-        self.update_image_status("waiting")
-        # Force UI update so users see the yellow status immediately
-        QApplication.processEvents()
+        if self.prompt_thread is None:
+            self.update_prompt_status("waiting")
+        if not self.running_jobs():
+            self.update_image_status("waiting")
         
-        # Get style
+        self.pump_jobs()
+    
+    def on_similar_images(self, job, matches):
+        """Offer saved images similar to a new job instead of generating it"""
+        job.thread.wait()
+        job.thread = None
+        if job.state != "matching":
+            return
+        if not matches:
+            self.queue_matched_job(job)
+            return
+        # The job waits for the user's choice; other jobs carry on
+        job.matches = matches
+        self.set_job_state(job, "offered")
+        best = matches[0]
+        self.log_status(
+            f"{len(matches)} saved image(s) look like '{job.phrase}' (best: '{best['phrase']}', "
+            f"similarity {best['score']:.2f}); select the job to use them or generate anyway"
+        )
+        self.update_job_status()
+    
+    def use_selected_matches(self):
+        """Finish the selected offered job with its saved matches"""
+        job = self.selected_job()
+        if job is not None and job.state == "offered":
+            self.reuse_saved_images(job, job.matches)
+    
+    def decline_selected_matches(self):
+        """Send the selected offered job on to generation"""
+        job = self.selected_job()
+        if job is not None and job.state == "offered":
+            self.queue_matched_job(job)
+    
+    def on_similar_images_error(self, job, error_msg):
+        job.thread.wait()
+        job.thread = None
+        self.log_error(f"Similar-images lookup failed: {error_msg}")
+        if job.state == "matching":
+            self.queue_matched_job(job)
+    
+    def queue_matched_job(self, job):
+        """Send a job without usable saved matches on to generation"""
+        self.set_job_state(job, "queued")
+        if self.prompt_thread is None:
+            self.update_prompt_status("waiting")
+        if not self.running_jobs():
+            self.update_image_status("waiting")
+        self.pump_jobs()
+    
+    def reuse_saved_images(self, job, matches):
+        """Finish a job with saved images instead of a Bing call"""
+        job.reused = True
+        job.prompt = matches[0]["prompt"]
+        job.image_urls = [(OUTPUT_DIR / match["filename"]).resolve().as_uri() for match in matches]
+        self.set_job_state(job, "done")
+        self.log_status(
+            f"Reusing {len(matches)} saved image(s) for '{job.phrase}': "
+            + ", ".join(match["filename"] for match in matches)
+        )
+        self.job_list.setCurrentItem(job.list_item)
+        self.update_job_status()
+    
+    def selected_style(self):
+        """Return the custom style if given, else the selected style"""
         custom_style = self.custom_style_input.text().strip()
         if custom_style:
-            style = custom_style
+            return custom_style
+        style_data = self.style_combo.currentData()
+        if style_data is None or style_data == "custom":
+            return "photorealistic"
+        return style_data
+    
+    def prompt_key(self, model, phrase, style, additional_info):
+        """Identify a prompt request, including whether the cache is bypassed"""
+        return (model, phrase, style, additional_info, self.force_regenerate_checkbox.isChecked())
+    
+    def schedule_speculation(self):
+        """Restart the debounce timer for speculative prompt generation"""
+        self.speculation_timer.start()
+    
+    def start_speculation(self):
+        """Generate the prompt for the current inputs before Generate is clicked"""
+        phrase = self.phrase_input.text().strip()
+        model = self.ollama_combo.currentText()
+        if (not self.speculate_checkbox.isChecked() or not phrase
+                or not model or model == DIRECT_PROMPT_MODEL):
+            self.cancel_speculation()
+            return
+        # Jobs that were actually submitted have Ollama to themselves
+        if self.prompt_thread is not None:
+            return
+        
+        style = self.selected_style()
+        additional_info = self.additional_info_input.text().strip()
+        key = self.prompt_key(model, phrase, style, additional_info)
+        if key in (self.speculative_key, self.last_submitted_key):
+            return
+        self.cancel_speculation()
+        
+        # Streamed so that a stale request can be aborted mid-generation
+        self.speculative_key = key
+        self.speculative_thread = PromptGenerationThread(
+            model, phrase, style, additional_info,
+            stream=True,
+            max_tokens=self.max_tokens_spin.value(),
+            cache=self.prompt_cache,
+            force=key[-1],
+            store=False
+        )
+        self.speculative_thread.finished.connect(self.on_speculation_finished)
+        self.speculative_thread.cancelled.connect(self.on_speculation_cancelled)
+        self.speculative_thread.start()
+    
+    def cancel_speculation(self):
+        """Abort the speculative prompt and forget any unused result"""
+        if self.speculative_thread is not None:
+            self.speculative_thread.cancel()
+            self.stale_speculations.append(self.speculative_thread)
+        self.speculative_key = None
+        self.speculative_thread = None
+        self.speculative_prompt = None
+    
+    def on_speculation_finished(self, prompt):
+        thread = self.sender()
+        if self.reap_detached(thread):
+            return
+        if thread is self.prompt_thread:
+            # A submitted job adopted this thread while it was running
+            self.on_prompt_finished(prompt)
+            return
+        thread.wait()
+        if thread in self.stale_speculations:
+            self.stale_speculations.remove(thread)
+            return
+        self.speculative_thread = None
+        # A failed request fell back to the direct prompt; let the job retry
+        if thread.complete:
+            self.speculative_prompt = prompt
+            self.speculative_cached = thread.cached
         else:
-            style_data = self.style_combo.currentData()
-            if style_data is None or style_data == "custom":
-                style = "photorealistic"
-            else:
-                style = style_data
+            self.speculative_key = None
+    
+    def on_speculation_cancelled(self):
+        thread = self.sender()
+        if self.reap_detached(thread):
+            return
+        if thread is self.prompt_thread:
+            self.on_prompt_cancelled()
+            return
+        thread.wait()
+        if thread in self.stale_speculations:
+            self.stale_speculations.remove(thread)
+        if thread is self.speculative_thread:
+            self.speculative_key = None
+            self.speculative_thread = None
+    
+    def use_speculation(self, job):
+        """Hand a speculative prompt to a job
         
-        # Store current phrase and style for logging
-        self.current_phrase = phrase
-        self.current_style = style
+        Returns True if the job got a finished prompt and is ready. A
+        speculation still running for the job becomes its prompt thread.
+        """
+        key = self.prompt_key(job.model, job.phrase, job.style, job.additional_info)
+        if key != self.speculative_key:
+            # Free Ollama for the submitted job
+            self.cancel_speculation()
+            return False
         
-        # Get additional info
-        additional_info = self.additional_info_input.text().strip()
+        if self.speculative_prompt is not None:
+            job.prompt = self.speculative_prompt
+            if not self.speculative_cached:
+                self.prompt_cache.put(*key[:4], job.prompt)
+            self.speculative_key = None
+            self.speculative_prompt = None
+            self.generated_prompt_display.setText(job.prompt)
+            self.log_status(f"Using pre-generated prompt: {job.prompt}")
+            self.set_job_state(job, "ready")
+            return True
         
-        # Generate prompt (this will update prompt status to Red then Green)
-        prompt = self.generate_prompt_with_ollama(phrase, style, additional_info)
-        self.current_prompt = prompt
-        self.generated_prompt_display.setText(prompt)
-        self.log_status(f"Using prompt: {prompt}")
+        thread = self.speculative_thread
+        thread.store = True
+        thread.cancel_token = job.token
+        # The Deadline (s) budget counts from when the stream started
+        thread.deadline_seconds = self.prompt_deadline_spin.value()
+        with thread.stream_lock:
+            self.generated_prompt_display.setText("".join(thread.streamed))
+            thread.token.connect(self.on_prompt_token)
+        thread.error.connect(self.log_error)
+        thread.status.connect(self.log_status)
+        self.speculative_key = None
+        self.speculative_thread = None
+        self.prompt_job = job
+        self.prompt_thread = thread
+        self.set_job_state(job, "prompting")
+        self.update_prompt_status("working")
+        self.cancel_prompt_btn.setEnabled(True)
+        self.log_status(f"Waiting for pre-generated prompt for '{job.phrase}'")
+        return False
+    
+    def running_jobs(self):
+        return [job for job in self.jobs if job.state == "generating"]
+    
+    def waiting_jobs(self):
+        return [job for job in self.jobs
+                if job.state in ("matching", "offered", "queued", "prompting", "ready")]
+    
+    def set_job_state(self, job, state):
+        """Update a job's state and its entry in the job list"""
+        job.state = state
+        job.list_item.setText(job.label())
+        if job is self.selected_job() and job is not self.displayed_job:
+            # Selecting the current item again does not signal, so refresh
+            # the preview of a selected job here
+            self.on_job_selected(job.list_item, None)
+    
+    def update_offer_buttons(self):
+        """Enable the offer buttons while the selected job has saved matches"""
+        job = self.selected_job()
+        offered = job is not None and job.state == "offered"
+        self.use_saved_btn.setEnabled(offered)
+        self.generate_anyway_btn.setEnabled(offered)
+    
+    def pump_jobs(self):
+        """Start prompt and image generation for queued jobs when workers are free"""
+        for job in self.waiting_jobs():
+            if job.state != "prompting" and job.token.is_cancelled():
+                self.drop_job(job, job.token.reason)
         
-        # Create ImageGenerator instance if not already created
-        try:
-            if not self.generator:
-                self.generator = ImageGenerator(
-                    auth_cookie_u=u_cookie,
-                    auth_cookie_srchhpgusr=srchhpgusr
+        # Prompt generation runs ahead of image generation
+        while self.prompt_thread is None:
+            job = next((j for j in self.jobs if j.state == "queued"), None)
+            if job is None:
+                break
+            if self.use_speculation(job):
+                continue
+            if self.prompt_thread is None:
+                self.prompt_job = job
+                self.set_job_state(job, "prompting")
+                self.update_prompt_status("working")
+                stream = self.stream_checkbox.isChecked() and job.model != DIRECT_PROMPT_MODEL
+                if stream:
+                    self.generated_prompt_display.clear()
+                self.prompt_thread = PromptGenerationThread(
+                    job.model, job.phrase, job.style, job.additional_info,
+                    stream=stream,
+                    max_tokens=self.max_tokens_spin.value(),
+                    deadline_seconds=self.prompt_deadline_spin.value(),
+                    cache=self.prompt_cache,
+                    force=self.force_regenerate_checkbox.isChecked(),
+                    cancel_token=job.token
                 )
+                self.prompt_thread.finished.connect(self.on_prompt_finished)
+                self.prompt_thread.cancelled.connect(self.on_prompt_cancelled)
+                self.prompt_thread.token.connect(self.on_prompt_token)
+                self.prompt_thread.error.connect(self.log_error)
+                self.prompt_thread.status.connect(self.log_status)
+                self.cancel_prompt_btn.setEnabled(True)
+                self.prompt_thread.start()
+        
+        free_slots = self.max_jobs_spin.value() - len(self.running_jobs())
+        for job in [j for j in self.jobs if j.state == "ready"][:max(free_slots, 0)]:
+            self.set_job_state(job, "generating")
             
-            num_images = self.num_images_spin.value()
-            
-            # Disable generate button 
-            self.generate_btn.setEnabled(False)
-            
-            # Set image status to working (red) and force UI update before thread starts
+            # Set image status to working (red) before thread starts
             self.update_image_status("working")
-            QApplication.processEvents()
             
             # Start generation thread
-            self.generation_thread = ImageGenerationThread(self.generator, prompt, num_images)
-            self.generation_thread.finished.connect(self.on_generation_finished)
-            self.generation_thread.error.connect(self.on_generation_error)
-            self.generation_thread.status.connect(self.log_status)
-            self.generation_thread.start()
-            
-        except Exception as e:
-            self.log_error(f"Failed to initialize: {str(e)}")
-            self.generate_btn.setEnabled(True)
+            job.thread = ImageGenerationThread(
+                self.scheduler, job.prompt, job.num_images, cancel_token=job.token
+            )
+            job.thread.finished.connect(partial(self.on_generation_finished, job))
+            job.thread.error.connect(partial(self.on_generation_error, job))
+            job.thread.cancelled.connect(partial(self.on_generation_cancelled, job))
+            job.thread.status.connect(self.log_status)
+            job.thread.start()
+    
+    def on_prompt_finished(self, prompt):
+        """Handle a generated prompt and hand the job on to image generation"""
+        if self.reap_detached(self.sender()):
+            return
+        job = self.prompt_job
+        job.prompt = prompt
+        # run() emits the result as its last step; wait for it to return
+        # before dropping the last reference to the thread
+        self.prompt_thread.wait()
+        if self.prompt_thread.complete and not self.prompt_thread.cached and job.model != DIRECT_PROMPT_MODEL:
+            # Ollama answered, so the model is loaded for another keep-alive period
+            self.mark_model_loaded(job.model)
+        self.prompt_thread = None
+        self.prompt_job = None
+        self.cancel_prompt_btn.setEnabled(False)
+        self.cache_status_label.setText(self.prompt_cache.stats_text())
+        self.http_status_label.setText(get_http_client().stats_text())
+        
+        self.generated_prompt_display.setText(prompt)
+        self.log_status(f"Using prompt: {prompt}")
+        self.update_prompt_status("done")
+        self.set_job_state(job, "ready")
+        self.pump_jobs()
+        self.schedule_speculation()
+    
+    def on_prompt_token(self, token):
+        """Append a streamed token to the generated prompt display"""
+        cursor = self.generated_prompt_display.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(token)
+        self.generated_prompt_display.setTextCursor(cursor)
+    
+    def cancel_prompt(self):
+        """Cancel the prompt currently being generated"""
+        if self.prompt_thread is not None:
+            self.cancel_prompt_btn.setEnabled(False)
+            self.prompt_thread.cancel()
+            self.log_status("Cancelling prompt generation...")
+    
+    def on_prompt_cancelled(self):
+        """Drop the job whose prompt generation was cancelled"""
+        if self.reap_detached(self.sender()):
+            return
+        job = self.prompt_job
+        self.prompt_thread.wait()
+        self.prompt_thread = None
+        self.prompt_job = None
+        self.cancel_prompt_btn.setEnabled(False)
+        
+        self.update_prompt_status("ready")
+        self.drop_job(job, job.token.reason or "cancelled")
+    
+    def cancel_selected_job(self):
+        """Cancel the job selected in the job list"""
+        job = self.selected_job()
+        if job is not None:
+            self.cancel_job(job)
+    
+    def cancel_job(self, job):
+        """Cancel a job in any state before done and free its slot at once"""
+        if job.state in ("done", "failed", "cancelled"):
+            return
+        job.token.cancel()
+        if job.state == "prompting" and job is self.prompt_job:
+            # A blocking Ollama request may take a while to notice; detach
+            # the thread so the next job's prompt can start right away
+            self.prompt_thread.cancel()
+            self.detached_threads.append(self.prompt_thread)
+            self.prompt_thread = None
+            self.prompt_job = None
+            self.cancel_prompt_btn.setEnabled(False)
             self.update_prompt_status("ready")
-            self.update_image_status("ready")
+        elif job.state == "generating":
+            # The generation thread notices the token within its poll interval
+            # and reports through on_generation_cancelled
+            return
+        self.drop_job(job, "cancelled")
     
-    def on_generation_finished(self, image_urls):
+    def reap_detached(self, thread):
+        """Let go of a detached thread once it has returned"""
+        if thread not in self.detached_threads:
+            return False
+        thread.wait()
+        self.detached_threads.remove(thread)
+        return True
+    
+    def drop_job(self, job, reason):
+        """Mark a job cancelled, or failed when its deadline passed, and move on"""
+        if reason == "cancelled":
+            self.set_job_state(job, "cancelled")
+            self.log_status(f"Cancelled '{job.phrase}'")
+        else:
+            job.error = reason
+            self.set_job_state(job, "failed")
+            self.log_error(f"Gave up on '{job.phrase}': {reason}")
+        if job is self.selected_job():
+            self.displayed_job = None
+            self.on_job_selected(job.list_item, None)
+        self.update_job_status()
+        self.pump_jobs()
+    
+    def on_generation_finished(self, job, image_urls):
         """Handle successful image generation"""
-        self.generate_btn.setEnabled(True)
+        job.thread.wait()
+        job.thread = None
         
         if not image_urls:
-            self.log_error("No images were generated")
+            job.error = "No images were generated"
+            self.set_job_state(job, "failed")
+            self.log_error(f"No images were generated for '{job.phrase}'")
+        else:
+            job.image_urls = image_urls
+            # Download every result in parallel so navigation never waits
+            self.prefetcher.prefetch(image_urls, job.token)
+            self.set_job_state(job, "done")
+            self.log_status(f"Successfully generated {len(image_urls)} image(s) for '{job.phrase}'")
+            
+            # Follow the finished job unless the user is viewing another result
+            selected = self.selected_job()
+            if selected is None or selected is job or selected.state != "done":
+                self.job_list.setCurrentItem(job.list_item)
+        
+        self.update_job_status()
+        self.pump_jobs()
+    
+    def on_generation_cancelled(self, job, reason):
+        """Free the slot of a job cancelled while Bing was working on it"""
+        job.thread.wait()
+        job.thread = None
+        self.drop_job(job, reason)
+    
+    def on_generation_error(self, job, error_msg):
+        """Handle generation errors"""
+        job.thread.wait()
+        job.thread = None
+        job.error = error_msg
+        self.set_job_state(job, "failed")
+        self.log_error(f"Generation failed for '{job.phrase}': {error_msg}")
+        self.update_job_status()
+        self.pump_jobs()
+    
+    def update_job_status(self):
+        """Set the image status indicator from the state of all jobs"""
+        if self.running_jobs():
+            self.update_image_status("working")
+        elif self.waiting_jobs():
+            self.update_image_status("waiting")
+        elif any(job.state == "done" for job in self.jobs):
+            self.update_image_status("done")
+        else:
             self.update_image_status("ready")
+    
+    def selected_job(self):
+        item = self.job_list.currentItem()
+        if item is None:
+            return None
+        return next((job for job in self.jobs if job.list_item is item), None)
+    
+    def on_job_selected(self, current, previous):
+        """Show the results of the selected job in the preview"""
+        self.update_offer_buttons()
+        job = self.selected_job()
+        if job is None or job is self.displayed_job:
+            return
+        if job.state != "done":
+            # Nothing to show yet; re-selecting the job later displays it
+            self.displayed_job = None
+            self.current_images = []
+            self.current_image_data = None
+            self.prev_btn.setEnabled(False)
+            self.next_btn.setEnabled(False)
+            self.save_btn.setEnabled(False)
+            self.save_all_btn.setEnabled(False)
+            if job.error:
+                self.image_label.setText(f"'{job.phrase}' failed: {job.error}")
+            elif job.state == "offered":
+                best = job.matches[0]
+                self.image_label.setText(
+                    f"{len(job.matches)} saved image(s) in the {job.style} style look like a match "
+                    f"for '{job.phrase}'\n(best: '{best['phrase']}', similarity {best['score']:.2f}).\n\n"
+                    "Use Saved shows them instead of generating new ones."
+                )
+            else:
+                self.image_label.setText(f"'{job.phrase}' is {job.state}")
             return
         
-        self.current_images = image_urls
+        self.displayed_job = job
+        # Store phrase, style and prompt of the displayed images for logging
+        self.current_phrase = job.phrase
+        self.current_style = job.style
+        self.current_prompt = job.prompt
+        self.current_images = job.image_urls
         self.current_image_index = 0
-        
-        self.log_status(f"Successfully generated {len(image_urls)} image(s)")
+        self.current_image_data = None
+        self.generated_prompt_display.setText(job.prompt)
         self.display_current_image()
         
         # Enable navigation
         self.update_navigation_buttons()
         self.save_btn.setEnabled(True)
-        
-        # Set final status to green
-        self.update_image_status("done")
-    
-    def on_generation_error(self, error_msg):
-        """Handle generation errors"""
-        self.generate_btn.setEnabled(True)
-        self.log_error(f"Generation failed: {error_msg}")
-        self.update_image_status("ready")
+        self.save_all_btn.setEnabled(True)
     
     def display_current_image(self):
         """Display the current image in the preview"""
         if not self.current_images:
             return
         
-        try:
+        url = self.current_images[self.current_image_index]
+        self.update_image_counter()
+        data = self.image_cache.get(url)
+        if data is None:
+            # Shown by on_image_loaded once the background fetch lands
+            self.current_image_data = None
+            self.image_label.setText("Loading image...")
+            self.prefetcher.prefetch([url])
+            return
+        
+        # Store original image data for saving
+        self.current_image_data = data
+        
+        content_hash = self.image_cache.content_hash(url)
+        self.update_image_counter(content_hash)
+        size = self.image_label.size()
+        key = (content_hash, size.width(), size.height())
+        scaled = self.scaled_images.get(key)
+        if scaled is not None:
+            self.image_label.setPixmap(QPixmap.fromImage(scaled))
+            return
+        
+        # Decode and scale to fit the label on the render pool; the result
+        # is shown by on_image_rendered
+        if key not in self.pending_renders:
+            self.pending_renders.add(key)
+            self.render_pool.start(ImageRenderTask(
+                self.render_signals, content_hash, data,
+                size.width(), size.height(), self.decoded_images, self.hash_index
+            ))
+    
+    def update_image_counter(self, content_hash=None):
+        """Show the image position, flagging images close to a saved one"""
+        text = f"{self.current_image_index + 1} / {len(self.current_images)}"
+        if content_hash in self.near_duplicates:
+            text += " (near-duplicate)"
+        self.image_counter_label.setText(text)
+    
+    def on_image_duplicate(self, content_hash, filename, distance):
+        """Flag a displayed image that resembles an image already saved"""
+        self.near_duplicates[content_hash] = (filename, distance)
+        self.log_status(
+            f"Image looks like {OUTPUT_DIR / filename} ({distance} of 64 hash bits differ)"
+        )
+        if self.current_images and self.current_image_data is not None:
             url = self.current_images[self.current_image_index]
-            response = requests.get(url, timeout=10)
-            
-            # Store original image data for saving
-            self.current_image_data = response.content
-            
-            pixmap = QPixmap()
-            pixmap.loadFromData(response.content)
-            
-            # Scale to fit label while maintaining aspect ratio
-            scaled_pixmap = pixmap.scaled(
-                self.image_label.size(),
-                Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation
-            )
-            
-            self.image_label.setPixmap(scaled_pixmap)
-            self.image_counter_label.setText(
-                f"{self.current_image_index + 1} / {len(self.current_images)}"
-            )
-        except Exception as e:
-            self.log_error(f"Failed to load image: {str(e)}")
+            if self.image_cache.content_hash(url) == content_hash:
+                self.update_image_counter(content_hash)
+    
+    def on_image_rendered(self, content_hash, width, height, image):
+        """Cache a scaled image and show it if it is still the one wanted"""
+        key = (content_hash, width, height)
+        self.pending_renders.discard(key)
+        self.scaled_images.put(key, image)
+        
+        if not self.current_images or self.current_image_data is None:
+            return
+        url = self.current_images[self.current_image_index]
+        size = self.image_label.size()
+        if key == (self.image_cache.content_hash(url), size.width(), size.height()):
+            self.image_label.setPixmap(QPixmap.fromImage(image))
+    
+    def on_image_render_failed(self, content_hash, error_msg):
+        """Report an image that could not be decoded"""
+        self.pending_renders = {key for key in self.pending_renders if key[0] != content_hash}
+        self.log_error(f"Failed to load image: {error_msg}")
+    
+    def closeEvent(self, event):
+        """Cancel all unfinished work so no thread outlives the window"""
+        for job in self.jobs:
+            job.token.cancel()
+        self.cancel_speculation()
+        threads = [job.thread for job in self.jobs if job.thread is not None]
+        threads += self.stale_speculations + self.detached_threads
+        for thread in [self.prompt_thread, self.warmup_thread, self.models_thread,
+                       self.embedding_thread]:
+            if thread is not None:
+                threads.append(thread)
+        for thread in threads:
+            if hasattr(thread, "cancel"):
+                thread.cancel()
+            # Streams stop at the next chunk and generation threads within
+            # their poll interval; blocking requests get a bounded wait
+            thread.wait(2000)
+        if self.gallery_panel is not None:
+            self.gallery_panel.model.pool.clear()
+            self.gallery_panel.model.pool.waitForDone(2000)
+        # Pending saves are finished rather than abandoned
+        for thread in self.save_threads:
+            thread.wait()
+        if self.postprocessor is not None:
+            self.postprocessor.shutdown()
+        super().closeEvent(event)
+    
+    def resizeEvent(self, event):
+        """Re-render the preview at the new size once resizing settles"""
+        super().resizeEvent(event)
+        if self.current_image_data is not None:
+            self.resize_timer.start()
+    
+    def on_image_loaded(self, url):
+        """Show a prefetched image if it is the one being viewed"""
+        self.http_status_label.setText(get_http_client().stats_text())
+        if self.current_images and self.current_images[self.current_image_index] == url:
+            if self.current_image_data is None:
+                self.display_current_image()
+    
+    def on_image_failed(self, url, error_msg):
+        """Report a failed background image download"""
+        if self.current_images and self.current_images[self.current_image_index] == url:
+            self.image_label.setText("Image failed to load")
+        self.log_error(f"Failed to load image: {error_msg}")
     
     def show_previous_image(self):
         """Show the previous image"""
@@ -602,31 +4699,101 @@ class BingImageCreatorGUI(QMainWindow):
         )
     
     def save_current_image(self):
-        """Save the current image to disk"""
+        """Save the current image to disk in the background"""
         if not self.current_images or not self.current_image_data:
             return
-        
-        try:
-            # Create output directory if it doesn't exist
-            output_dir = Path("Output")
-            output_dir.mkdir(exist_ok=True)
-            
-            # Format filename: phrase_style_0001.jpg
-            phrase = self.current_phrase.replace(" ", "_")
-            style = self.current_style.replace(" ", "_").replace("/", "-")
-            filename = output_dir / f"{phrase}_{style}_{self.image_counter:04d}.jpg"
-            
-            # Save original image data (not scaled version)
-            with open(filename, "wb") as f:
-                f.write(self.current_image_data)
-            
-            # Log to JSON file
-            self.log_to_json(filename.name)
-            
-            self.image_counter += 1
-            self.log_status(f"✓ Saved: {filename}")
-        except Exception as e:
-            self.log_error(f"Failed to save image: {str(e)}")
+        self.start_save([(
+            self.current_images[self.current_image_index], self.current_image_data,
+            self.current_phrase, self.current_style, self.current_prompt
+        )])
+    
+    def save_all_images(self):
+        """Save every image of the displayed job in the background"""
+        job = self.displayed_job
+        if job is None or not job.image_urls:
+            return
+        self.start_save([
+            (url, self.image_cache.get(url), job.phrase, job.style, job.prompt)
+            for url in job.image_urls
+        ])
+    
+    def start_save(self, items):
+        """Hand images to a background writer"""
+        thread = ImageSaveThread(
+            items, self.image_cache, self.output_catalog, self.generation_log, self.hash_index,
+            skip_duplicates=self.skip_duplicates_checkbox.isChecked()
+        )
+        thread.saved.connect(lambda name: self.log_status(f"✓ Saved: {OUTPUT_DIR / name}"))
+        thread.duplicate.connect(self.on_save_duplicate)
+        thread.failed.connect(
+            lambda name, msg: self.log_error(f"Failed to save {name or 'image'}: {msg}")
+        )
+        thread.finished.connect(partial(self.on_save_finished, thread))
+        self.save_threads.append(thread)
+        thread.start()
+    
+    def on_save_duplicate(self, nearest, distance, saved):
+        """Report a save that resembles an image already in Output"""
+        if saved:
+            self.log_status(f"Saved a near-duplicate of {OUTPUT_DIR / nearest} (distance {distance})")
+        else:
+            self.log_status(f"Skipped near-duplicate of {OUTPUT_DIR / nearest} (distance {distance})")
+    
+    def on_save_finished(self, thread, count, total_bytes, seconds):
+        """Report the throughput of a finished save"""
+        thread.wait()
+        self.save_threads.remove(thread)
+        if not count:
+            return
+        if self.postprocess_checkbox.isChecked():
+            self.postprocess_images(thread.written)
+        self.sync_embedding_index()
+        if self.gallery_panel is not None and self.gallery_panel.isVisible():
+            self.gallery_panel.refresh()
+        megabytes = total_bytes / 1e6
+        rate = megabytes / seconds if seconds > 0 else 0.0
+        self.log_status(
+            f"Saved {count} image(s), {megabytes:.2f} MB in {seconds:.2f}s ({rate:.1f} MB/s); "
+            f"logged to {self.generation_log.path}"
+        )
+    
+    def postprocess_images(self, items):
+        """Hand saved (filename, phrase, style, prompt) items to the process pool"""
+        if self.postprocessor is None:
+            self.postprocessor = PostProcessor(output_catalog=self.output_catalog)
+            self.postprocess_notifier = PostProcessNotifier(self.postprocessor)
+            self.postprocess_notifier.failed.connect(
+                lambda name, msg: self.log_error(f"Failed to post-process {name}: {msg}")
+            )
+            self.postprocess_notifier.finished.connect(self.on_postprocess_finished)
+        self.postprocessor.quality = self.jpeg_quality_spin.value()
+        self.postprocess_notifier.post(items)
+    
+    def on_postprocess_finished(self, processed, failed, seconds):
+        """Report the throughput of a post-processed save"""
+        if self.gallery_panel is not None and self.gallery_panel.isVisible():
+            self.gallery_panel.refresh()
+        if not processed:
+            return
+        rate = processed / seconds if seconds > 0 else 0.0
+        self.log_status(
+            f"Post-processed {processed} image(s) in {seconds:.2f}s ({rate:.1f} images/s, "
+            f"{self.postprocessor.workers} process(es))"
+        )
+    
+    def show_gallery(self):
+        """Open the gallery of saved images"""
+        if self.gallery_panel is None:
+            self.gallery_panel = GalleryPanel(self.generation_log, ThumbnailCache(), self)
+        self.gallery_panel.show()
+        self.gallery_panel.raise_()
+    
+    def show_metrics(self):
+        """Open the per-stage latency panel"""
+        if self.metrics_panel is None:
+            self.metrics_panel = MetricsPanel(METRICS, self)
+        self.metrics_panel.show()
+        self.metrics_panel.raise_()
     
     def log_status(self, message):
         """Log a status message"""
@@ -688,43 +4855,621 @@ class BingImageCreatorGUI(QMainWindow):
         elif status == "done":
             self.image_status_label.setText("● Image Gen: Done")
             self.image_status_label.setStyleSheet("color: green; font-weight: bold;")
+
+
+class StageStats:
+    """Throughput counters for one batch pipeline stage"""
     
-    def log_to_json(self, filename):
-        """Log generation details to JSON file"""
-        try:
-            # Create output directory if it doesn't exist
-            output_dir = Path("Output")
-            output_dir.mkdir(exist_ok=True)
-            
-            # Load existing log or create new one
-            log_data = []
-            if self.log_file.exists():
-                with open(self.log_file, "r", encoding="utf-8") as f:
-                    log_data = json.load(f)
-            
-            # Add new entry
-            entry = {
-                "word_phrase": self.current_phrase,
-                "style": self.current_style,
-                "ai_generated_prompt": self.current_prompt,
-                "date_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "filename": filename
-            }
-            log_data.append(entry)
-            
-            # Save updated log
-            with open(self.log_file, "w", encoding="utf-8") as f:
-                json.dump(log_data, f, indent=2, ensure_ascii=False)
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.first_start = None
+        self.last_end = None
+        self.lock = threading.Lock()
+    
+    def record(self, started, ended, ok=True, count=1):
+        with self.lock:
+            if ok:
+                self.items += count
+            else:
+                self.errors += count
+            self.busy_seconds += ended - started
+            if self.first_start is None or started < self.first_start:
+                self.first_start = started
+            if self.last_end is None or ended > self.last_end:
+                self.last_end = ended
+    
+    def summary(self):
+        """Return a one-line throughput summary"""
+        wall = (self.last_end - self.first_start) if self.first_start is not None else 0.0
+        rate = self.items / wall if wall > 0 else 0.0
+        avg = self.busy_seconds / max(self.items + self.errors, 1)
+        return (f"{self.name:<10} items={self.items:<6} errors={self.errors:<4} "
+                f"wall={wall:8.2f}s avg={avg:7.3f}s throughput={rate:7.3f}/s")
+
+
+class BatchPipeline:
+    """Headless phrase -> prompt -> image -> download -> save pipeline
+    
+    Each stage runs its own pool of worker threads connected by bounded
+    queues, so Ollama prompt generation, Bing generation, CDN downloads and
+    disk writes overlap instead of running one phrase at a time. Progress is
+    kept in a JobJournal, and rows it has seen before continue from their
+    last recorded stage. With a PostProcessor, saved files are handed to
+    its process pool without waiting for the result.
+    """
+    STAGES = ("prompt", "generate", "download", "save")
+    
+    def __init__(self, scheduler, model=DIRECT_PROMPT_MODEL, num_images=1,
+                 workers=None, queue_size=8, output_dir=OUTPUT_DIR, prompt_cache=None,
+                 force_regenerate=False, prompt_chunk_size=1, job_deadline=0,
+                 skip_duplicates=True, postprocessor=None):
+        self.scheduler = scheduler
+        # Seconds a phrase may take from prompt to save; 0 for no limit
+        self.job_deadline = job_deadline
+        self.model = model
+        # Phrases sent to Ollama per request; 1 sends each phrase on its own
+        self.prompt_chunk_size = max(1, prompt_chunk_size)
+        self.prompt_cache = prompt_cache
+        self.force_regenerate = force_regenerate
+        self.num_images = num_images
+        self.workers = {"prompt": 2, "generate": 1, "download": 4, "save": 1}
+        self.workers.update(workers or {})
+        self.output_dir = Path(output_dir)
+        self.generation_log = GenerationLog(
+            self.output_dir / "generation_log.db", self.output_dir / "generation_log.json"
+        )
+        self.queues = {stage: queue.Queue(maxsize=queue_size) for stage in self.STAGES}
+        self.stats = {stage: StageStats(stage) for stage in self.STAGES}
+        self.output_catalog = OutputCatalog(self.output_dir)
+        self.journal = JobJournal(self.output_dir / "job_journal.db")
+        self.hash_index = HashIndex(self.output_dir / ".cache" / "image_hashes.db", self.output_dir)
+        self.skip_duplicates = skip_duplicates
+        # (phrase, nearest filename, distance) of skipped near-duplicates
+        self.duplicates = []
+        # Rows per stage they were resumed at, plus "done" for finished ones
+        self.resumed = {}
+        self.postprocessor = postprocessor
+        if postprocessor is not None and postprocessor.output_catalog is None:
+            postprocessor.output_catalog = self.output_catalog
+    
+    @staticmethod
+    def load_rows(path):
+        """Load (phrase, style, additional_info) rows from a CSV or JSONL file"""
+        path = Path(path)
+        rows = []
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            if path.suffix.lower() in (".jsonl", ".ndjson"):
+                records = (json.loads(line) for line in f if line.strip())
+            else:
+                records = csv.DictReader(f)
+            for record in records:
+                phrase = (record.get("phrase") or "").strip()
+                if not phrase:
+                    continue
+                rows.append({
+                    "phrase": phrase,
+                    "style": (record.get("style") or "").strip() or "photorealistic",
+                    "additional_info": (record.get("additional_info") or "").strip()
+                })
+        return rows
+    
+    def run(self, rows):
+        """Run all rows through the pipeline and block until done"""
+        handlers = {
+            "prompt": self.stage_prompt,
+            "generate": self.stage_generate,
+            "download": self.stage_download,
+            "save": self.stage_save
+        }
+        threads = {}
+        for index, stage in enumerate(self.STAGES):
+            next_queue = self.queues[self.STAGES[index + 1]] if index + 1 < len(self.STAGES) else None
+            target = self.worker
+            if stage == "prompt" and self.prompt_chunk_size > 1 and self.model != DIRECT_PROMPT_MODEL:
+                target, handlers[stage] = self.chunk_worker, self.stage_prompt_chunk
+            threads[stage] = [
+                threading.Thread(
+                    target=target, args=(stage, handlers[stage], next_queue),
+                    name=f"batch-{stage}-{n}", daemon=True
+                )
+                for n in range(max(1, self.workers[stage]))
+            ]
+            for thread in threads[stage]:
+                thread.start()
+        
+        occurrences = {}
+        for row in rows:
+            base = (row["phrase"], row["style"], row["additional_info"])
+            occurrences[base] = occurrences.get(base, 0) + 1
+            item = dict(row, job_key=self.journal.make_key(
+                self.model, self.num_images, *base, occurrences[base]
+            ))
+            for stage, entry in self.resume(item):
+                self.queues[stage].put(entry)
+        
+        # Shut stages down in order: once every worker of a stage has seen
+        # its sentinel, nothing more can reach the next stage
+        for stage in self.STAGES:
+            for _ in threads[stage]:
+                self.queues[stage].put(None)
+            for thread in threads[stage]:
+                thread.join()
+        return self.stats
+    
+    def resume(self, item):
+        """Return the (stage, item) pairs that continue a row where it stopped"""
+        key = item["job_key"]
+        if self.force_regenerate:
+            self.journal.reset(key)
+        job = self.journal.lookup(key)
+        if job is None:
+            self.journal.start(key, item["phrase"], item["style"])
+        if job is None or job["prompt"] is None:
+            return [("prompt", item)]
+        
+        item["prompt"] = job["prompt"]
+        if not job["images"]:
+            stage = "generate"
+            entries = [(stage, item)]
+        else:
+            stage = "download"
+            entries = []
+            for url, state, filename in job["images"]:
+                if state != "saved" and filename and (self.output_dir / filename).exists():
+                    # Interrupted after the file was renamed into place
+                    self.finish_save(dict(item, url=url), filename, resumed=True)
+                elif state != "saved":
+                    entries.append((stage, dict(item, url=url)))
+            if not entries:
+                stage = "done"
+        self.resumed[stage] = self.resumed.get(stage, 0) + 1
+        return entries
+    
+    def admit(self, stage, item):
+        """Start the phrase's deadline on entry and drop it once expired"""
+        token = item.setdefault("token", CancelToken(self.job_deadline or None))
+        if not token.is_cancelled():
+            return True
+        now = time.perf_counter()
+        self.stats[stage].record(now, now, ok=False)
+        print(f"[ERROR] {stage} skipped for '{item['phrase']}': {token.reason}", file=sys.stderr)
+        return False
+    
+    def worker(self, stage, handler, next_queue):
+        while True:
+            item = self.queues[stage].get()
+            if item is None:
+                return
+            if not self.admit(stage, item):
+                continue
+            started = time.perf_counter()
+            try:
+                outputs = handler(item)
+            except Exception as e:
+                self.stats[stage].record(started, time.perf_counter(), ok=False)
+                print(f"[ERROR] {stage} failed for '{item['phrase']}': {e}", file=sys.stderr)
+                continue
+            self.stats[stage].record(started, time.perf_counter())
+            if next_queue is not None:
+                for output in outputs:
+                    next_queue.put(output)
+    
+    def chunk_worker(self, stage, handler, next_queue):
+        """Like worker(), but hands up to prompt_chunk_size queued items to the handler at once"""
+        while True:
+            item = self.queues[stage].get()
+            if item is None:
+                return
+            items = [item]
+            finished = False
+            while len(items) < self.prompt_chunk_size:
+                try:
+                    # Wait briefly so a chunk can fill while rows are still arriving
+                    item = self.queues[stage].get(timeout=0.05)
+                except queue.Empty:
+                    break
+                if item is None:
+                    finished = True
+                    break
+                items.append(item)
+            items = [item for item in items if self.admit(stage, item)]
+            if not items:
+                if finished:
+                    return
+                continue
             
-            self.log_status(f"Logged to {self.log_file}")
+            started = time.perf_counter()
+            try:
+                outputs = handler(items)
+            except Exception as e:
+                self.stats[stage].record(started, time.perf_counter(), ok=False, count=len(items))
+                print(f"[ERROR] {stage} failed for {len(items)} phrase(s): {e}", file=sys.stderr)
+            else:
+                self.stats[stage].record(started, time.perf_counter(), count=len(outputs))
+                if next_queue is not None:
+                    for output in outputs:
+                        next_queue.put(output)
+            if finished:
+                return
+    
+    def cached_prompt(self, item):
+        if self.prompt_cache is None or self.force_regenerate:
+            return None
+        return self.prompt_cache.get(self.model, item["phrase"], item["style"], item["additional_info"])
+    
+    def stage_prompt(self, item):
+        phrase, style, info = item["phrase"], item["style"], item["additional_info"]
+        if self.model == DIRECT_PROMPT_MODEL:
+            item["prompt"] = direct_prompt(phrase, style, info)
+            self.journal.prompted(item["job_key"], item["prompt"])
+            return [item]
+        
+        cached = self.cached_prompt(item)
+        if cached:
+            item["prompt"] = cached
+        else:
+            self.generate_prompt(item)
+        self.journal.prompted(item["job_key"], item["prompt"])
+        return [item]
+    
+    def stage_prompt_chunk(self, items):
+        """Generate prompts for a chunk of phrases with one Ollama request
+        
+        Entries missing from the answer fall back to single requests.
+        Phrases past their deadline are dropped on their own; the rest of
+        the chunk is passed on.
+        """
+        dropped = set()
+        
+        def drop(item, error):
+            dropped.add(id(item))
+            now = time.perf_counter()
+            self.stats["prompt"].record(now, now, ok=False)
+            print(f"[ERROR] prompt dropped for '{item['phrase']}': {error}", file=sys.stderr)
+        
+        pending = []
+        timeouts = []
+        for item in items:
+            cached = self.cached_prompt(item)
+            if cached:
+                item["prompt"] = cached
+                continue
+            try:
+                timeouts.append(item["token"].timeout(120))
+            except JobCancelled as e:
+                drop(item, e)
+                continue
+            pending.append(item)
+        
+        retry = pending
+        if len(pending) > 1:
+            keys = [(item["phrase"], item["style"], item["additional_info"]) for item in pending]
+            try:
+                prompts = ollama_generate_prompts(self.model, keys, timeout=min(timeouts))
+            except Exception as e:
+                print(f"[ERROR] Batched Ollama request failed: {e}, retrying singly", file=sys.stderr)
+                prompts = [None] * len(pending)
+            retry = []
+            for item, key, prompt in zip(pending, keys, prompts):
+                if prompt is None:
+                    retry.append(item)
+                    continue
+                item["prompt"] = prompt
+                if self.prompt_cache is not None:
+                    self.prompt_cache.put(self.model, *key, prompt)
+            if retry and len(retry) < len(pending):
+                print(f"[INFO] {len(retry)} of {len(pending)} batched prompt(s) unusable, retrying singly")
+        
+        for item in retry:
+            try:
+                self.generate_prompt(item)
+            except JobCancelled as e:
+                drop(item, e)
+        items = [item for item in items if id(item) not in dropped]
+        for item in items:
+            self.journal.prompted(item["job_key"], item["prompt"])
+        return items
+    
+    def generate_prompt(self, item):
+        """Generate one prompt with Ollama, falling back to the direct prompt"""
+        phrase, style, info = item["phrase"], item["style"], item["additional_info"]
+        try:
+            item["prompt"] = ollama_generate_prompt(self.model, phrase, style, info,
+                                                    timeout=item["token"].timeout(30))
+            if self.prompt_cache is not None:
+                self.prompt_cache.put(self.model, phrase, style, info, item["prompt"])
+        except JobCancelled:
+            raise
+        except Exception as e:
+            item["token"].check()
+            print(f"[ERROR] Ollama error: {e}, using direct prompt", file=sys.stderr)
+            item["prompt"] = direct_prompt(phrase, style, info)
+        return item
+    
+    def stage_generate(self, item):
+        future = self.scheduler.submit(item["prompt"], self.num_images, PRIORITY_BATCH,
+                                       token=item["token"])
+        urls = wait_for_result(future, item["token"])
+        if not urls:
+            raise RuntimeError("No images were generated")
+        self.journal.generated(item["job_key"], urls)
+        return [dict(item, url=url) for url in urls]
+    
+    def stage_download(self, item):
+        item["data"] = get_http_client().get_bytes(item["url"], timeout=item["token"].timeout(10))
+        # Hashed here rather than in the save stage, which has fewer workers
+        try:
+            with METRICS.span("dhash"):
+                item["dhash"] = dhash_bytes(item["data"])
+        except ValueError:
+            item["dhash"] = None
+        self.journal.fetched(item["job_key"], item["url"])
+        return [item]
+    
+    def stage_save(self, item):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        allocate = partial(self.output_catalog.allocate, item["phrase"], item["style"])
+        if item["dhash"] is None:
+            filename = allocate()
+        else:
+            skip_within = DEDUP_MAX_DISTANCE if self.skip_duplicates else -1
+            filename, nearest, distance = self.hash_index.claim(item["dhash"], allocate, skip_within)
+            if filename is None:
+                self.duplicates.append((item["phrase"], nearest, distance))
+                self.journal.saved(item["job_key"], item["url"])
+                print(f"[INFO] Skipped near-duplicate of {self.output_dir / nearest} "
+                      f"(distance {distance}) for '{item['phrase']}'")
+                return []
+        self.journal.saving(item["job_key"], item["url"], filename)
+        try:
+            with METRICS.span("file_write"):
+                with self.output_catalog.writing():
+                    atomic_write(self.output_dir / filename, item["data"])
+        except Exception:
+            self.hash_index.remove(filename)
+            raise
+        self.finish_save(item, filename)
+        return []
+    
+    def finish_save(self, item, filename, resumed=False):
+        """Catalog, log and journal a file that is on disk
+        
+        The log and the journal are separate databases, so a crash can land
+        between the two commits. A resumed save only logs the file if that
+        entry did not make it in before.
+        """
+        self.output_catalog.record(filename)
+        if not resumed or not self.generation_log.count(filename=filename):
+            self.generation_log.append([
+                make_log_entry(item["phrase"], item["style"], item["prompt"], filename)
+            ])
+        self.journal.saved(item["job_key"], item["url"])
+        print(f"[INFO] Saved: {self.output_dir / filename}")
+        if self.postprocessor is not None:
+            future = self.postprocessor.submit(filename, item["phrase"], item["style"], item["prompt"])
+            future.add_done_callback(partial(self.on_postprocessed, filename))
+    
+    def on_postprocessed(self, filename, future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"[ERROR] Failed to post-process {self.output_dir / filename}: "
+                  f"{future.exception()}", file=sys.stderr)
+
+
+def run_batch(args):
+    """Run the headless batch pipeline from parsed command line arguments"""
+    global OLLAMA_KEEP_ALIVE
+    accounts_file = Path(args.accounts) if args.accounts else ACCOUNTS_FILE
+    if accounts_file.exists():
+        pool = CookiePool.from_file(accounts_file)
+        print(f"[INFO] Using {len(pool.accounts)} Bing account(s) from {accounts_file}")
+    else:
+        u_cookie = os.getenv("BING_IMG_U", "")
+        srchhpgusr = os.getenv("BING_IMG_SRCHHPGUSR", "")
+        if not u_cookie or not srchhpgusr:
+            print("[ERROR] Set BING_IMG_U and BING_IMG_SRCHHPGUSR or provide --accounts for batch mode",
+                  file=sys.stderr)
+            return 1
+        pool = CookiePool.single(
+            load_image_generator()(auth_cookie_u=u_cookie, auth_cookie_srchhpgusr=srchhpgusr)
+        )
+    
+    rows = BatchPipeline.load_rows(args.batch)
+    if not rows:
+        print(f"[ERROR] No rows found in {args.batch}", file=sys.stderr)
+        return 1
+    postprocessor = None
+    if args.postprocess:
+        if not pillow_available():
+            print("[ERROR] --postprocess needs Pillow (pip install Pillow)", file=sys.stderr)
+            return 1
+        postprocessor = PostProcessor(args.output_dir, quality=args.jpeg_quality,
+                                      workers=args.postprocess_workers)
+    
+    scheduler = GenerationScheduler(
+        pool,
+        rate_per_minute=args.rate_per_minute,
+        workers=args.generate_workers,
+        max_attempts=args.max_attempts
+    )
+    pipeline = BatchPipeline(
+        scheduler,
+        model=args.model or DIRECT_PROMPT_MODEL,
+        num_images=args.num_images,
+        workers={
+            "prompt": args.prompt_workers,
+            "generate": args.generate_workers,
+            "download": args.download_workers,
+            "save": args.save_workers
+        },
+        queue_size=args.queue_size,
+        output_dir=args.output_dir,
+        prompt_cache=PromptCache(Path(args.output_dir) / ".cache" / "prompt_cache.db"),
+        force_regenerate=args.force_regenerate,
+        prompt_chunk_size=args.prompt_chunk_size,
+        job_deadline=args.job_deadline,
+        skip_duplicates=not args.keep_duplicates,
+        postprocessor=postprocessor
+    )
+    
+    model = args.model or DIRECT_PROMPT_MODEL
+    auto_keep_alive = model != DIRECT_PROMPT_MODEL and args.keep_alive is None
+    if auto_keep_alive:
+        # Keep the model loaded for the expected length of the batch, which
+        # the Bing rate limit dominates, plus some slack
+        estimate = len(rows) / max(args.rate_per_minute, 0.1) * 60 + 300
+        OLLAMA_KEEP_ALIVE = f"{int(estimate)}s"
+    if model != DIRECT_PROMPT_MODEL:
+        try:
+            seconds = ollama_load_model(model)
+            print(f"[INFO] Loaded {model} in {seconds:.1f}s (keep-alive {OLLAMA_KEEP_ALIVE})")
         except Exception as e:
-            self.log_error(f"Failed to log to JSON: {str(e)}")
+            print(f"[ERROR] Failed to load {model}: {e}", file=sys.stderr)
+    
+    print(f"[INFO] Processing {len(rows)} row(s) from {args.batch}")
+    started = time.perf_counter()
+    try:
+        stats = pipeline.run(rows)
+        if postprocessor is not None:
+            postprocessor.wait()
+            postprocessor.shutdown()
+    except KeyboardInterrupt:
+        print("\n[INFO] Interrupted; run the same command again to resume", file=sys.stderr)
+        return 130
+    elapsed = time.perf_counter() - started
+    if pipeline.resumed:
+        print("[INFO] Resumed from the job journal: " + ", ".join(
+            f"{count} {'already saved' if stage == 'done' else 'at ' + stage}"
+            for stage, count in pipeline.resumed.items()
+        ))
+    if auto_keep_alive:
+        # Hand the model back to Ollama's default idle timeout
+        try:
+            ollama_load_model(model, keep_alive="5m")
+        except Exception:
+            pass
+    
+    print(f"\nStage throughput ({elapsed:.2f}s total):")
+    for stage in BatchPipeline.STAGES:
+        print(f"  {stats[stage].summary()}")
+    print(f"  {pipeline.prompt_cache.stats_text()}")
+    print(f"  dedup: {len(pipeline.duplicates)} near-duplicate image(s) skipped")
+    if postprocessor is not None:
+        print(f"  {postprocessor.stats_text()}")
+    print(f"  {get_http_client().stats_text()}")
+    print(f"  {scheduler.stats_text()}")
+    
+    print("\nStage latency:")
+    for line in METRICS.summary_lines():
+        print(f"  {line}")
+    if args.trace_out:
+        METRICS.export_chrome_trace(args.trace_out)
+        print(f"[INFO] Wrote Chrome trace to {args.trace_out}")
+    if args.metrics_out:
+        METRICS.export_prometheus(args.metrics_out)
+        print(f"[INFO] Wrote Prometheus metrics to {args.metrics_out}")
+    return 0 if stats["save"].items or pipeline.resumed.get("done") == len(rows) else 1
+
+
+def parse_args(argv):
+    """Parse command line arguments, leaving Qt's own options untouched"""
+    parser = argparse.ArgumentParser(description="Bing Image Creator GUI")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="Run headless over a CSV/JSONL of phrase,style,additional_info rows")
+    parser.add_argument("--model", default=None,
+                        help="Ollama model for prompt generation (default: direct prompt)")
+    parser.add_argument("--num-images", type=int, default=1, choices=range(1, 5),
+                        help="Images to generate per phrase")
+    parser.add_argument("--prompt-workers", type=int, default=2)
+    parser.add_argument("--prompt-chunk-size", type=int, default=1,
+                        help="Phrases sent to Ollama per request; values above 1 use one JSON "
+                             "request per chunk (at most --queue-size)")
+    parser.add_argument("--generate-workers", type=int, default=1)
+    parser.add_argument("--download-workers", type=int, default=4)
+    parser.add_argument("--save-workers", type=int, default=1)
+    parser.add_argument("--accounts", metavar="FILE",
+                        help=f"JSON file of Bing accounts to pool (default: {ACCOUNTS_FILE} if present)")
+    parser.add_argument("--rate-per-minute", type=float, default=6,
+                        help="Maximum Bing generation requests per minute")
+    parser.add_argument("--max-attempts", type=int, default=4,
+                        help="Attempts per phrase before a generation is given up")
+    parser.add_argument("--job-deadline", type=float, default=0,
+                        help="Seconds a phrase may take from prompt to save before it is dropped "
+                             "(default: no limit)")
+    parser.add_argument("--queue-size", type=int, default=8,
+                        help="Capacity of the queue in front of each stage")
+    parser.add_argument("--output-dir", default=str(OUTPUT_DIR))
+    parser.add_argument("--keep-alive", default=None,
+                        help="How long Ollama keeps the model loaded between requests, e.g. 30m or -1 "
+                             f"(default: {OLLAMA_KEEP_ALIVE}, or the expected duration in batch mode)")
+    parser.add_argument("--force-regenerate", action="store_true",
+                        help="Ignore cached prompts and the job journal and generate new variants")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="Save images even when they look almost the same as one already saved")
+    parser.add_argument("--postprocess", action="store_true",
+                        help="Re-encode saved images as JPEG with embedded metadata and "
+                             "write web and print size variants (needs Pillow)")
+    parser.add_argument("--jpeg-quality", type=int, default=JPEG_QUALITY, choices=range(1, 101),
+                        metavar="1-100", help="JPEG quality of post-processed images")
+    parser.add_argument("--postprocess-workers", type=int, default=None,
+                        help="Post-processing processes (default: half the CPU cores)")
+    parser.add_argument("--backfill-hashes", action="store_true",
+                        help="Add every image in --output-dir to the near-duplicate index and exit")
+    parser.add_argument("--http-pool-size", type=int, default=8,
+                        help="Keep-alive connections kept per host")
+    parser.add_argument("--http-retries", type=int, default=2,
+                        help="Retries for failed idempotent HTTP requests")
+    parser.add_argument("--http-timeout", type=float, default=30,
+                        help="HTTP read timeout in seconds")
+    parser.add_argument("--http2", action="store_true",
+                        help="Download images over HTTP/2 (requires httpx[http2])")
+    parser.add_argument("--trace-out", metavar="FILE",
+                        help="Write stage spans as a Chrome trace JSON file after a batch")
+    parser.add_argument("--metrics-out", metavar="FILE",
+                        help="Write stage latencies as a Prometheus text file after a batch")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print import and initialization timings to stderr")
+    return parser.parse_known_args(argv)
 
 
 def main():
-    app = QApplication(sys.argv)
-    window = BingImageCreatorGUI()
+    global _startup_timings, OLLAMA_KEEP_ALIVE
+    args, qt_args = parse_args(sys.argv[1:])
+    if args.keep_alive is not None:
+        try:
+            keep_alive_seconds(args.keep_alive)
+        except ValueError as e:
+            print(f"[ERROR] {e}", file=sys.stderr)
+            sys.exit(2)
+        # Ollama reads unitless values as seconds only when sent as numbers
+        OLLAMA_KEEP_ALIVE = int(args.keep_alive) if args.keep_alive.lstrip("-").isdigit() else args.keep_alive
+    if args.profile_startup:
+        _startup_timings = [("module imports (PyQt6, stdlib)", _MODULE_IMPORTED - _MODULE_START)]
+    configure_http_client(
+        pool_maxsize=args.http_pool_size,
+        timeout=(5, args.http_timeout),
+        retries=args.http_retries,
+        http2=args.http2
+    )
+    if args.backfill_hashes:
+        started = time.perf_counter()
+        hashed, removed, failed = backfill_hash_index(args.output_dir)
+        print(f"[INFO] Indexed {hashed} image(s) and dropped {removed} deleted one(s) "
+              f"in {time.perf_counter() - started:.1f}s")
+        sys.exit(1 if failed else 0)
+    if args.batch:
+        sys.exit(run_batch(args))
+    
+    with startup_step("create QApplication"):
+        app = QApplication(sys.argv[:1] + qt_args)
+    with startup_step("create main window"):
+        window = BingImageCreatorGUI(args.accounts)
     window.show()
+    if args.profile_startup:
+        # Runs once the event loop has painted the first frame
+        QTimer.singleShot(0, report_startup)
     sys.exit(app.exec())
 
 